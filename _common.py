@@ -10,18 +10,31 @@ Contains common (utility) functions for the MoVeDo Pandoc filters.
 
 This is typicaly used by importing it into panflute filter scripts:
 import * from _common
+
+Each filter is implemented as a subclass of `Filter`,
+which holds the filters parameters and per-document state,
+so multiple documents may be processed by a single process,
+one filter instance per document (or per thread/task).
 """
 
 from __future__ import print_function
 
 import re
 import sys
+import html
 
 # constants
-REGEX_URL = re.compile(r'^(?:[a-z:_-]+)://', re.IGNORECASE)
-REGEX_ABS_PATH = re.compile(r'^([A-Z]:)?[/\\]', re.IGNORECASE)
-REGEX_SPECIAL_LINK = re.compile(r'^mailto:', re.IGNORECASE)
+# NOTE These are compiled (and cached) by `re` on first use,
+#      to not slow down the start-up of filters that never need them.
+REGEX_URL = r'(?i)^(?:[a-z:_-]+)://'
+REGEX_ABS_PATH = r'(?i)^([A-Z]:)?[/\\]'
+REGEX_SPECIAL_LINK = r'(?i)^mailto:'
+REGEX_DATA_URI = r'(?i)^data:'
+REGEX_HTML_ATTR = r'''(?i)\s(%s)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+))'''
 REQUIRED_VERSION = (3, 6)
+HASH_CHUNK_SIZE = 1024 * 1024
+# permissions of newly created files, see `default_file_mode()`
+_DEFAULT_FILE_MODE = None
 
 def check_version():
     """Checks whether we are running on the minimum required python version."""
@@ -51,9 +64,106 @@ def is_special_link(a_str):
     """
     return re.match(REGEX_SPECIAL_LINK, a_str) is not None
 
+def is_data_uri(a_str):
+    """
+    Returns True if the argument is a "data:*" URI,
+    which contains the (possibly huge) resource itsself.
+    """
+    return re.match(REGEX_DATA_URI, a_str) is not None
+
 def is_rel_path(a_str):
     """Returns True if the argument is an absolute, local file path."""
-    return not (is_url(a_str) or is_abs_path(a_str) or is_special_link(a_str))
+    return not (is_data_uri(a_str) or is_url(a_str)
+                or is_abs_path(a_str) or is_special_link(a_str))
+
+def file_digest(path):
+    """
+    Returns the SHA-256 hex-digest of a files content,
+    reading it in chunks, so large files do not end up in memory as a whole.
+    """
+    import hashlib
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def content_addressed_path(asset_dir, digest, suffix):
+    """
+    Returns the path of a content-addressed file within `asset_dir`,
+    using '/' as separator, as in links.
+    """
+    return '%s/%s%s' % (asset_dir.rstrip('/\\'), digest, suffix.lower())
+
+def default_file_mode():
+    """
+    Returns the permissions of newly created files,
+    e.g. 0o644 with the usual umask of 0o022.
+    NOTE Call this once before starting any threads,
+         as reading the umask briefly changes it for the whole process.
+    """
+    global _DEFAULT_FILE_MODE
+    if _DEFAULT_FILE_MODE is None:
+        import os
+        # NOTE The umask can only be read by setting it
+        umask = os.umask(0o022)
+        os.umask(umask)
+        _DEFAULT_FILE_MODE = 0o666 & ~umask
+    return _DEFAULT_FILE_MODE
+
+def move_into_place(tmp_path, path):
+    """
+    Moves a temporary file (as created by `tempfile.mkstemp()`,
+    with owner-only permissions) to `path`,
+    giving it the permissions of a normally created file.
+    """
+    import os
+    os.chmod(tmp_path, default_file_mode())
+    os.replace(tmp_path, path)
+
+def parse_html(text):
+    """
+    Parses a piece of HTML with BeautifulSoup.
+    bs4 is only imported on first use,
+    as most documents contain no raw HTML at all.
+    """
+    # TODO Instead of bs4/BeautifulSoup for parsing HTML, use pandoc itsself - panflute has functions for that, see its docu
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(text, 'html.parser')
+
+def html_attr_values(text, attrs=('href', 'src')):
+    """
+    Yields the values of the given attributes in a piece of HTML,
+    of any tag, without parsing it.
+    Like HTML itsself, attribute names are matched case-insensitively.
+    """
+    regex = REGEX_HTML_ATTR % '|'.join(attrs)
+    for match in re.finditer(regex, text):
+        value = next(group for group in match.groups()[1:] if group is not None)
+        if '&' in value:
+            value = html.unescape(value)
+        yield value
+
+def html_needs_rewrite(text, transform, attrs=('href', 'src')):
+    """
+    Returns True if `transform` would change the value
+    of any of the given attributes in a piece of HTML.
+    This is much cheaper than parsing the HTML,
+    which would copy e.g. huge "data:*" URIs,
+    so filters call it before `parse_html()`.
+    """
+    return any(transform(value) != value for value in html_attr_values(text, attrs))
+
+def parse_meta_args(meta_args):
+    """
+    Parses a list of 'key=value' strings (as given to pandoc with '-M')
+    into a dict.
+    """
+    metadata = {}
+    for meta_arg in meta_args:
+        key, _, value = meta_arg.partition('=')
+        metadata[key] = value
+    return metadata
 
 def get_arg(doc, key, default_value=None):
     """
@@ -70,3 +180,47 @@ def get_arg(doc, key, default_value=None):
              "Use for example '-M %s=\"some_value\"' on the command line.")
             % (key, key))
     return value
+
+class Filter:
+    """
+    Base class for a panflute filter that keeps its parameters and state
+    in the instance, instead of in module globals.
+
+    Parameters are read from the pandoc meta-data of each document,
+    unless given to the constructor, in which case those take precedence;
+    for example: `ShiftHeaders(sh_shift='2')`.
+    """
+
+    def __init__(self, **params):
+        self.params = params
+
+    def get_arg(self, doc, key, default_value=None):
+        """
+        Like the module level `get_arg()`,
+        but prefers the parameters given to the constructor.
+        """
+        if key in self.params:
+            return self.params[key]
+        return get_arg(doc, key, default_value)
+
+    def prepare(self, doc):
+        """The panflute filter init method."""
+
+    def action(self, elem, doc):
+        """The panflute filter main method, called once per element."""
+        return elem
+
+    def finalize(self, doc):
+        """The panflute filter "destructor" method."""
+
+    def run(self, doc=None):
+        """
+        Runs this filter on `doc`,
+        or on the JSON AST from stdin to stdout if it is `None`.
+        """
+        import panflute as pf
+        return pf.run_filter(
+            self.action,
+            prepare=self.prepare,
+            finalize=self.finalize,
+            doc=doc)
@@ -30,83 +30,82 @@ $ pandoc -f markdown -t markdown --markdown-headings=atx \
         input.md
 """
 
-from _common import check_version, is_rel_path, get_arg
+from _common import check_version, is_rel_path, html_needs_rewrite, parse_html, Filter
 check_version()
 
 import re
 import panflute as pf
-# TODO Instead of bs4/BeautifulSoup for parsing HTML, use pandoc itsself - panflute has functions for that, see its docu
-from bs4 import BeautifulSoup
 
-# parameters
-# should be something like 'some/static/prefix/'
-prefix = '<default-prefix>'
-# should be something like 'file-name.md'
-file_name = '<default-file-name>'
-
-def prefix_if_rel_path(url):
-    """
-    Prefixes the input URL with the prefix,
-    if the URL is a link to/image with a relative path.
-    """
-    global prefix, file_name
-    if is_rel_path(url):
-        if url.startswith('#'):
-            url = file_name + url
-        else:
-            url = prefix + url
-    return url
-
-def prefix_elem_if_rel_path(elem):
-    """
-    Prefixes the URL of an input element with the prefix,
-    if the URL is a link to/image with a relative path.
-    """
-    elem.url = prefix_if_rel_path(elem.url)
-
-def prefix_html(elem):
-    """Prepends the reference-formatted relative file path to the identifier."""
-    parsed = BeautifulSoup(elem.text, 'html.parser')
-    replaced = False
-    anchors_with_href = parsed.findAll(
-        lambda tag:
-        tag.name == "a" and tag.get("href") is not None)
-    for anchor in anchors_with_href:
-        new_href = prefix_if_rel_path(anchor.get("href"))
-        if new_href != anchor.get("href"):
-            anchor["href"] = new_href
-            replaced = True
-    imgs_with_src = parsed.findAll(
-        lambda tag:
-        tag.name == "img" and tag.get("src") is not None)
-    for img in imgs_with_src:
-        new_src = prefix_if_rel_path(img.get("src"))
-        if new_src != img.get("src"):
-            img["src"] = new_src
-            replaced = True
-    if replaced:
-        elem.text = str(parsed)
-        # HACK Remove end-tag automatically inserted by BeautifulSoup as a sanitation matter, see https://stackoverflow.com/questions/57868615/how-to-disable-the-sanitizer-beautifulsoup
-        elem.text = re.sub(r'></[^>]+>$', '>', elem.text)
-    #eprint("XXX allp HTML after '%s'" % elem.text)
-
-def prepare(doc):
-    """The panflute filter init method."""
-    global prefix, file_name
-    prefix = get_arg(doc, 'allp_prefix')
-    file_name = get_arg(doc, 'allp_file')
-
-def action(elem, doc):
-    """The panflute filter main method, called once per element."""
-    if isinstance(elem, (pf.Link, pf.Image)):
-        prefix_elem_if_rel_path(elem)
-    if isinstance(elem, pf.RawInline) and elem.format == 'html':
-        prefix_html(elem)
-    return elem
-
-def finalize(doc):
-    """The panflute filter "destructor" method."""
-    pass
+class AddLocalLinkPrefix(Filter):
+    """Adds a prefix to all local, relative link & image paths."""
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        # parameters
+        # should be something like 'some/static/prefix/'
+        self.prefix = '<default-prefix>'
+        # should be something like 'file-name.md'
+        self.file_name = '<default-file-name>'
+
+    def prefix_if_rel_path(self, url):
+        """
+        Prefixes the input URL with the prefix,
+        if the URL is a link to/image with a relative path.
+        """
+        if is_rel_path(url):
+            if url.startswith('#'):
+                url = self.file_name + url
+            else:
+                url = self.prefix + url
+        return url
+
+    def prefix_elem_if_rel_path(self, elem):
+        """
+        Prefixes the URL of an input element with the prefix,
+        if the URL is a link to/image with a relative path.
+        """
+        elem.url = self.prefix_if_rel_path(elem.url)
+
+    def prefix_html(self, elem):
+        """Prepends the reference-formatted relative file path to the identifier."""
+        if not html_needs_rewrite(elem.text, self.prefix_if_rel_path):
+            return
+        parsed = parse_html(elem.text)
+        replaced = False
+        anchors_with_href = parsed.findAll(
+            lambda tag:
+            tag.name == "a" and tag.get("href") is not None)
+        for anchor in anchors_with_href:
+            new_href = self.prefix_if_rel_path(anchor.get("href"))
+            if new_href != anchor.get("href"):
+                anchor["href"] = new_href
+                replaced = True
+        imgs_with_src = parsed.findAll(
+            lambda tag:
+            tag.name == "img" and tag.get("src") is not None)
+        for img in imgs_with_src:
+            new_src = self.prefix_if_rel_path(img.get("src"))
+            if new_src != img.get("src"):
+                img["src"] = new_src
+                replaced = True
+        if replaced:
+            elem.text = str(parsed)
+            # HACK Remove end-tag automatically inserted by BeautifulSoup as a sanitation matter, see https://stackoverflow.com/questions/57868615/how-to-disable-the-sanitizer-beautifulsoup
+            elem.text = re.sub(r'></[^>]+>$', '>', elem.text)
+        #eprint("XXX allp HTML after '%s'" % elem.text)
+
+    def prepare(self, doc):
+        """The panflute filter init method."""
+        self.prefix = self.get_arg(doc, 'allp_prefix')
+        self.file_name = self.get_arg(doc, 'allp_file')
+
+    def action(self, elem, doc):
+        """The panflute filter main method, called once per element."""
+        if isinstance(elem, (pf.Link, pf.Image)):
+            self.prefix_elem_if_rel_path(elem)
+        if isinstance(elem, pf.RawInline) and elem.format == 'html':
+            self.prefix_html(elem)
+        return elem
 
 def main(doc=None):
     """
@@ -114,11 +113,7 @@ def main(doc=None):
     if we want to be able to run filters automatically
     with '-F panflute'
     """
-    return pf.run_filter(
-        action,
-        prepare=prepare,
-        finalize=finalize,
-        doc=doc)
+    return AddLocalLinkPrefix().run(doc)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 Robin Vobruba <hoijui.quaero@gmail.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+This is part of the [MoVeDo](https://github.com/movedo) project.
+See LICENSE.md for copyright information.
+
+A local cache of parsed documents (Pandoc ASTs),
+so unchanged sources do not have to be parsed by pandoc again and again,
+e.g. once per output format and once per separately run filter chain.
+
+The cache key consists of the hash of the source content,
+the source file extension (from which pandoc guesses the reader, if not given),
+the pandoc version and the reader options.
+Each AST is stored in Pythons compact binary `marshal` format,
+which is loaded directly from a memory-mapped file.
+When the cache grows above its maximum size,
+the least recently used entries are evicted.
+
+It can be used from Python, to feed the filters directly:
+
+    from ast_cache import AstCache
+    import normalize_links
+    cache = AstCache('.ast-cache')
+    doc = cache.load('input.md', ['-f', 'markdown'], output_format='markdown')
+    doc = normalize_links.main(doc=doc)
+
+or on the command line, to produce the JSON AST for pandoc:
+
+$ python3 ast_cache.py \
+        --cache-dir .ast-cache \
+        --max-size 1073741824 \
+        -o input.json \
+        input.md \
+        -- -f markdown
+$ pandoc -f json -t markdown --filter normalize_links.py -o output.md input.json
+"""
+
+from _common import check_version, file_digest
+check_version()
+
+import os
+import sys
+import json
+import mmap
+import marshal
+import hashlib
+import argparse
+import tempfile
+import functools
+import subprocess
+
+# constants
+DEFAULT_CACHE_DIR = '.ast-cache'
+# 1 GiB
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+CACHE_FILE_SUFFIX = '.ast'
+
+@functools.lru_cache(maxsize=None)
+def pandoc_version(pandoc='pandoc'):
+    """Returns the version string of the given pandoc executable."""
+    output = subprocess.run([pandoc, '--version'], check=True,
+                            stdout=subprocess.PIPE).stdout
+    return output.decode('utf-8').splitlines()[0].strip()
+
+def parse_with_pandoc(source_file, reader_args, pandoc='pandoc'):
+    """Parses a document with pandoc, returning its raw JSON AST."""
+    output = subprocess.run(
+        [pandoc] + list(reader_args) + ['-t', 'json', source_file],
+        check=True, stdout=subprocess.PIPE).stdout
+    return json.loads(output.decode('utf-8'))
+
+def elements_from_json(node):
+    """
+    Converts a raw JSON AST into panflute elements,
+    just like `panflute.load()` does through its JSON object hook.
+    """
+    from panflute.elements import from_json
+    if isinstance(node, dict):
+        return from_json({key: elements_from_json(value) for key, value in node.items()})
+    if isinstance(node, list):
+        return [elements_from_json(value) for value in node]
+    return node
+
+class AstCache:
+    """A size-bounded, content-addressed cache of Pandoc ASTs."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE, pandoc='pandoc'):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.pandoc = pandoc
+
+    def key(self, source_file, reader_args=()):
+        """Returns the cache key for a source file parsed with the given reader options."""
+        key = hashlib.sha256()
+        extension = os.path.splitext(source_file)[1].lower()
+        for part in [file_digest(source_file), extension, pandoc_version(self.pandoc),
+                     str(marshal.version)] + list(reader_args):
+            key.update(part.encode('utf-8'))
+            key.update(b'\0')
+        return key.hexdigest()
+
+    def path(self, key):
+        """Returns the path of the cache file for a key."""
+        return os.path.join(self.cache_dir, key + CACHE_FILE_SUFFIX)
+
+    def read(self, key):
+        """Returns the raw JSON AST stored under the key, or None."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as ifh:
+                with mmap.mmap(ifh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    raw = marshal.loads(mapped)
+        except (FileNotFoundError, ValueError, EOFError, TypeError):
+            # missing, empty or corrupt
+            return None
+        # mark as recently used; best effort, as the entry might just have been
+        # evicted by another process, or the cache might be read-only
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return raw
+
+    def write(self, key, raw):
+        """Stores a raw JSON AST under the key, and evicts old entries if required."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(tmp_fd, 'wb') as ofh:
+            marshal.dump(raw, ofh)
+        os.replace(tmp_path, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries, until the cache fits its max size."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(CACHE_FILE_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def load_raw(self, source_file, reader_args=()):
+        """Returns the raw JSON AST of the source file, parsing it only if not cached."""
+        key = self.key(source_file, reader_args)
+        raw = self.read(key)
+        if raw is None:
+            raw = parse_with_pandoc(source_file, reader_args, self.pandoc)
+            self.write(key, raw)
+        return raw
+
+    def load(self, source_file, reader_args=(), output_format='html'):
+        """
+        Returns the source file as a `panflute.Doc`,
+        ready to be passed to a filters `main(doc=...)`.
+        """
+        doc = elements_from_json(self.load_raw(source_file, reader_args))
+        doc.format = output_format
+        return doc
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        description='Writes the (cached) Pandoc JSON AST of a document.')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='the cache directory (default: %(default)s)')
+    parser.add_argument('--max-size', type=int, default=DEFAULT_MAX_SIZE,
+                        help='the max total size of the cache in bytes (default: %(default)s)')
+    parser.add_argument('--pandoc', default='pandoc',
+                        help='the pandoc executable (default: %(default)s)')
+    parser.add_argument('-o', '--output', default='-',
+                        help='the output file, or "-" for stdout (default)')
+    parser.add_argument('input',
+                        help='the source document')
+    parser.add_argument('reader_args', nargs=argparse.REMAINDER,
+                        help='pandoc reader options, after "--"')
+    args = parser.parse_args(argv)
+    reader_args = args.reader_args
+    if reader_args[:1] == ['--']:
+        reader_args = reader_args[1:]
+
+    cache = AstCache(args.cache_dir, args.max_size, args.pandoc)
+    raw = cache.load_raw(args.input, reader_args)
+    if args.output == '-':
+        json.dump(raw, sys.stdout, separators=(',', ':'))
+    else:
+        with open(args.output, 'w', encoding='utf-8') as ofh:
+            json.dump(raw, ofh, separators=(',', ':'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 Robin Vobruba <hoijui.quaero@gmail.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+This is part of the [MoVeDo](https://github.com/movedo) project.
+See LICENSE.md for copyright information.
+
+Measures the cold start-up time of each filter,
+as that is most of the cost when filtering small documents.
+
+Each filter module is imported in a fresh interpreter, multiple times,
+and the best and median wall-clock times are reported,
+minus the start-up time of a bare interpreter.
+The results may be saved as a baseline,
+and later runs compared against it,
+failing if any filter got slower by more than the tolerance.
+The committed baseline is `bench_baseline.json`;
+after changing the imports or start-up code of a filter,
+compare against it as shown below,
+and update it (with `--save`) when the new times are intended.
+NOTE Absolute times depend on the machine,
+so the baseline should be re-generated when switching machines.
+
+Usage example:
+$ python3 bench_startup.py --save bench_baseline.json
+$ python3 bench_startup.py --baseline bench_baseline.json --tolerance 0.25
+$ python3 make_bundle.py -o movedo-filters.pyz
+$ python3 bench_startup.py --bundle movedo-filters.pyz
+"""
+
+from _common import check_version, eprint
+check_version()
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# constants
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+FILTERS = [
+    'add_local_link_prefix',
+    'ast_cache',
+    'check_urls',
+    'concat_docs',
+    'consolidate_images',
+    'debug',
+    'externalize_data_uris',
+    'extract_header_structure',
+    'header_pagebreaks',
+    'linearize_links',
+    'normalize_links',
+    'replace_link_suffixes',
+    'rewrite_md_links',
+    'shift_headers',
+]
+# the reference, subtracted from all measurements
+BARE = '<bare interpreter>'
+
+def time_import(module, path_entry, runs):
+    """Returns the wall-clock times of importing a module in fresh interpreters."""
+    if module == BARE:
+        code = 'pass'
+    else:
+        code = 'import sys; sys.path.insert(0, %r); import %s' % (path_entry, module)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        # run outside of SRC_DIR, so only `path_entry` provides the filters
+        subprocess.run([sys.executable, '-c', code], check=True, cwd=tempfile.gettempdir())
+        times.append(time.perf_counter() - start)
+    return times
+
+def bench(modules, path_entry, runs):
+    """Returns module -> {'best': ms, 'median': ms}, relative to a bare interpreter."""
+    bare = time_import(BARE, path_entry, runs)
+    bare_best = min(bare)
+    bare_median = statistics.median(bare)
+    results = {}
+    for module in modules:
+        times = time_import(module, path_entry, runs)
+        results[module] = {
+            'best': round((min(times) - bare_best) * 1000, 1),
+            'median': round((statistics.median(times) - bare_median) * 1000, 1),
+        }
+    return results
+
+def compare(results, baseline, tolerance):
+    """Returns the modules that got slower than the baseline by more than the tolerance."""
+    regressions = []
+    for module, result in results.items():
+        if module in baseline:
+            allowed = baseline[module]['best'] * (1 + tolerance)
+            if result['best'] > allowed:
+                regressions.append((module, baseline[module]['best'], result['best']))
+    return regressions
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        description='Measures the cold start-up time of each filter.')
+    parser.add_argument('-n', '--runs', type=int, default=10,
+                        help='how many times to start each filter (default: %(default)s)')
+    parser.add_argument('--bundle',
+                        help='measure the filters in this bundle (see make_bundle.py) instead of the sources')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results as JSON, e.g. as a baseline')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='compare against the results saved in this file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slow-down relative to the baseline (default: %(default)s)')
+    parser.add_argument('filters', nargs='*', default=FILTERS,
+                        help='the filters to measure (default: all)')
+    args = parser.parse_args(argv)
+
+    if args.bundle:
+        # importing the modules alone would not run the bundles `__main__`
+        from make_bundle import check_bundle
+        check_bundle(args.bundle)
+    path_entry = os.path.abspath(args.bundle) if args.bundle else SRC_DIR
+    results = bench(args.filters, path_entry, args.runs)
+    print('%-28s %10s %10s' % ('filter', 'best [ms]', 'median [ms]'))
+    for module, result in results.items():
+        print('%-28s %10.1f %10.1f' % (module, result['best'], result['median']))
+    if args.save:
+        with open(args.save, 'w') as ofh:
+            json.dump(results, ofh, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline, 'r') as ifh:
+            baseline = json.load(ifh)
+        regressions = compare(results, baseline, args.tolerance)
+        for module, before, after in regressions:
+            eprint("Start-up regression in %s: %.1f ms -> %.1f ms" % (module, before, after))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
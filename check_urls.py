@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 Robin Vobruba <hoijui.quaero@gmail.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+This is part of the [MoVeDo](https://github.com/movedo) project.
+See LICENSE.md for copyright information.
+
+Checks whether all external (http & https) link & image targets
+of a document are reachable.
+This includes the `href` of HTML `<a>` and the `src` of HTML `<img>` tags.
+The document itself is not modified.
+
+Each URL is checked only once (ignoring the fragment),
+using `HEAD` requests (falling back to `GET` if the server does not allow it).
+The checks run concurrently,
+with a limited number of concurrent requests per host,
+and connections are kept alive and reused per host.
+Results are stored in a cache file,
+and not checked again until they are older than `cu_ttl` seconds,
+so repeated builds do not re-request them.
+Connection errors and time-outs are only cached for `cu_error_ttl` seconds,
+so a short network failure does not affect the results for long.
+
+Unreachable URLs are reported on stderr,
+and optionally written to a report file, one per line,
+as "<status-or-error> <URL>".
+
+It is implemented as a Pandoc filter using panflute.
+
+Usage example:
+$ pandoc -f markdown -t markdown --markdown-headings=atx \
+        -M cu_cache_file=".url-check-cache.json" \
+        -M cu_ttl=86400 \
+        -M cu_error_ttl=300 \
+        -M cu_per_host=4 \
+        -M cu_jobs=32 \
+        -M cu_timeout=10 \
+        -M cu_report_file="broken_urls.txt" \
+        -M cu_fail=False \
+        --filter check_urls.py \
+        -o output.md \
+        input.md
+"""
+
+from _common import check_version, eprint, is_url, parse_html, Filter
+check_version()
+
+import os
+import json
+import time
+import asyncio
+import http.client
+from urllib.parse import urlsplit, urldefrag, quote
+from concurrent.futures import ThreadPoolExecutor
+import panflute as pf
+
+# constants
+USER_AGENT = 'movedo-check-urls/1.0'
+CHECKABLE_SCHEMES = ('http', 'https')
+# status codes for which we retry with GET instead of HEAD
+HEAD_NOT_SUPPORTED = (405, 501)
+# characters left as they are when percent-encoding path and query
+URL_SAFE_CHARS = "/%?=&;:@!$'()*+,~-._"
+
+def is_ok(status):
+    """Returns True if the HTTP status denotes a reachable URL."""
+    return status is not None and 200 <= status < 400
+
+class UrlCache:
+    """A persistent cache of URL check results, with a time-to-live."""
+
+    def __init__(self, cache_file=None, ttl=86400, error_ttl=300):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        # for results without an HTTP status (connection errors, time-outs)
+        self.error_ttl = error_ttl
+        # URL -> [check time, status or None, error or None]
+        self.entries = {}
+
+    def load(self):
+        """Loads the cache from its file, if it exists."""
+        if self.cache_file and os.path.isfile(self.cache_file):
+            with open(self.cache_file, 'r') as fh:
+                self.entries = json.load(fh)
+
+    def save(self):
+        """Writes the cache to its file."""
+        if self.cache_file:
+            tmp_file = self.cache_file + '.tmp'
+            with open(tmp_file, 'w') as fh:
+                json.dump(self.entries, fh)
+            os.replace(tmp_file, self.cache_file)
+
+    def get(self, url):
+        """Returns the cached (status, error) for the URL, or None if expired."""
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        ttl = self.ttl if entry[1] is not None else self.error_ttl
+        if time.time() - entry[0] > ttl:
+            return None
+        return (entry[1], entry[2])
+
+    def put(self, url, status, error):
+        """Stores a check result."""
+        self.entries[url] = [time.time(), status, error]
+
+class HostPool:
+    """
+    Keeps alive connections per host,
+    and limits the number of concurrent requests per host.
+    """
+
+    def __init__(self, per_host=4, timeout=10):
+        self.per_host = per_host
+        self.timeout = timeout
+        # (scheme, netloc) -> list of idle connections
+        self.idle = {}
+        # (scheme, netloc) -> asyncio.Semaphore
+        self.semaphores = {}
+
+    def semaphore(self, key):
+        """Returns the semaphore limiting concurrent requests to a host."""
+        if key not in self.semaphores:
+            self.semaphores[key] = asyncio.Semaphore(self.per_host)
+        return self.semaphores[key]
+
+    def acquire(self, key):
+        """Returns an idle connection to the host, or a new one."""
+        idle = self.idle.get(key)
+        if idle:
+            return idle.pop(), True
+        scheme, netloc = key
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        else:
+            conn = http.client.HTTPConnection(netloc, timeout=self.timeout)
+        return conn, False
+
+    def release(self, key, conn):
+        """Returns a still usable connection to the pool."""
+        self.idle.setdefault(key, []).append(conn)
+
+    def close(self):
+        """Closes all idle connections."""
+        for conns in self.idle.values():
+            for conn in conns:
+                conn.close()
+        self.idle = {}
+
+def request_status(conn, method, path):
+    """
+    Sends a single request over the connection and returns its status,
+    and whether the connection may be reused.
+    """
+    conn.request(method, path, headers={'User-Agent': USER_AGENT})
+    resp = conn.getresponse()
+    if method == 'HEAD':
+        resp.read()
+        return resp.status, not resp.will_close
+    # Do not download whole bodies just to check for existence
+    resp.close()
+    return resp.status, False
+
+def request_target(url):
+    """
+    Returns the host key (scheme, netloc) and the request path of a URL,
+    encoded to plain ASCII (IDNA for the host, percent-encoding for the rest).
+    """
+    parts = urlsplit(url)
+    host = parts.hostname
+    if not host:
+        raise ValueError("Missing host")
+    host = host.encode('idna').decode('ascii')
+    if ':' in host:
+        # IPv6 address
+        host = '[' + host + ']'
+    if parts.port is not None:
+        host = '%s:%d' % (host, parts.port)
+    path = quote(parts.path or '/', safe=URL_SAFE_CHARS)
+    if parts.query:
+        path = path + '?' + quote(parts.query, safe=URL_SAFE_CHARS)
+    return (parts.scheme.lower(), host), path
+
+async def check_url(url, pool, executor):
+    """Checks a single URL, returning (status, error)."""
+    loop = asyncio.get_event_loop()
+    try:
+        key, path = request_target(url)
+    except ValueError as exc:
+        return None, '%s: %s' % (type(exc).__name__, exc)
+    async with pool.semaphore(key):
+        status = None
+        error = None
+        for method in ('HEAD', 'GET'):
+            for _ in range(2):
+                conn, reused = pool.acquire(key)
+                try:
+                    status, reusable = await loop.run_in_executor(
+                        executor, request_status, conn, method, path)
+                except (OSError, ValueError, http.client.HTTPException) as exc:
+                    conn.close()
+                    status = None
+                    error = '%s: %s' % (type(exc).__name__, exc)
+                    if reused:
+                        # the server might have closed an idle keep-alive connection
+                        continue
+                    break
+                if reusable:
+                    pool.release(key, conn)
+                else:
+                    conn.close()
+                error = None
+                break
+            if status not in HEAD_NOT_SUPPORTED:
+                break
+    return status, error
+
+async def check_urls_async(urls, pool, executor):
+    """Checks all URLs concurrently, returning a dict URL -> (status, error)."""
+    results = await asyncio.gather(
+        *[check_url(url, pool, executor) for url in urls],
+        return_exceptions=True)
+    # an unexpected error only fails its own URL, not the whole batch
+    return {
+        url: (None, '%s: %s' % (type(result).__name__, result))
+        if isinstance(result, Exception) else result
+        for url, result in zip(urls, results)}
+
+def check_urls(urls, cache, per_host=4, jobs=32, timeout=10):
+    """
+    Checks all the given URLs that are not (freshly) cached,
+    and returns a dict URL -> (status, error) for all of them.
+    """
+    results = {}
+    to_check = []
+    for url in sorted(set(urls)):
+        cached = cache.get(url)
+        if cached is None:
+            to_check.append(url)
+        else:
+            results[url] = cached
+    if to_check:
+        pool = HostPool(per_host, timeout)
+        loop = asyncio.new_event_loop()
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                checked = loop.run_until_complete(
+                    check_urls_async(to_check, pool, executor))
+        finally:
+            loop.close()
+            pool.close()
+        for url, (status, error) in checked.items():
+            cache.put(url, status, error)
+        results.update(checked)
+    return results
+
+def is_checkable_url(url):
+    """Returns True if the argument is an external URL we can check."""
+    return is_url(url) and urlsplit(url).scheme.lower() in CHECKABLE_SCHEMES
+
+class CheckUrls(Filter):
+    """Checks whether external link & image targets are reachable."""
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        # parameters
+        self.cache = UrlCache()
+        self.per_host = 4
+        self.jobs = 32
+        self.timeout = 10
+        self.report_file = ''
+        self.fail = False
+        # state
+        self.urls = set()
+
+    def add_url(self, url):
+        """Collects the URL, if it is an external one."""
+        if is_checkable_url(url):
+            self.urls.add(urldefrag(url)[0])
+
+    def add_html_urls(self, elem):
+        """Collects each a.href and img.src URL in a piece of HTML."""
+        parsed = parse_html(elem.text)
+        for anchor in parsed.findAll(
+                lambda tag:
+                tag.name == "a" and tag.get("href") is not None):
+            self.add_url(anchor.get("href"))
+        for img in parsed.findAll(
+                lambda tag:
+                tag.name == "img" and tag.get("src") is not None):
+            self.add_url(img.get("src"))
+
+    def prepare(self, doc):
+        """The panflute filter init method."""
+        self.cache = UrlCache(self.get_arg(doc, 'cu_cache_file', ''),
+                              float(self.get_arg(doc, 'cu_ttl', '86400')),
+                              float(self.get_arg(doc, 'cu_error_ttl', '300')))
+        self.cache.load()
+        self.per_host = int(self.get_arg(doc, 'cu_per_host', '4'))
+        self.jobs = int(self.get_arg(doc, 'cu_jobs', '32'))
+        self.timeout = float(self.get_arg(doc, 'cu_timeout', '10'))
+        self.report_file = self.get_arg(doc, 'cu_report_file', '')
+        self.fail = self.get_arg(doc, 'cu_fail', 'False') == 'True'
+        self.urls = set()
+
+    def action(self, elem, doc):
+        """The panflute filter main method, called once per element."""
+        if isinstance(elem, (pf.Link, pf.Image)):
+            self.add_url(elem.url)
+        if isinstance(elem, pf.RawInline) and elem.format == 'html':
+            self.add_html_urls(elem)
+        return elem
+
+    def finalize(self, doc):
+        """The panflute filter "destructor" method."""
+        results = check_urls(self.urls, self.cache,
+                             self.per_host, self.jobs, self.timeout)
+        self.cache.save()
+        broken = [(url, status, error)
+                  for url, (status, error) in sorted(results.items())
+                  if not is_ok(status)]
+        for url, status, error in broken:
+            eprint("Unreachable URL (%s): %s" % (error or status, url))
+        if self.report_file:
+            with open(self.report_file, 'w') as ofh:
+                for url, status, error in broken:
+                    ofh.write('%s %s\n' % (status or error.split(':')[0], url))
+        if broken and self.fail:
+            raise ValueError("%d unreachable URL(s) found" % len(broken))
+
+def main(doc=None):
+    """
+    NOTE: The main function has to be exactly like this
+    if we want to be able to run filters automatically
+    with '-F panflute'
+    """
+    return CheckUrls().run(doc)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 Robin Vobruba <hoijui.quaero@gmail.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+This is part of the [MoVeDo](https://github.com/movedo) project.
+See LICENSE.md for copyright information.
+
+Concatenates many Pandoc JSON ASTs into a single one,
+applying the per-file link prefix (`add_local_link_prefix.py`),
+link normalization (`normalize_links.py`),
+link linearization (`linearize_links.py`)
+and header shifting (`shift_headers.py`)
+to each of them on the fly.
+
+The documents are read and filtered one after the other,
+and their top-level blocks are streamed to the output right away,
+so the combined document is never held in memory as a whole;
+peak memory usage is proportional to the largest single input document.
+The meta-data of the combined document is the one of the first input.
+
+Each input is given as `DOC_PATH=JSON_FILE`,
+where `DOC_PATH` is the path of the source document
+relative to the root of the combined document,
+which is used to derive the per-file filter parameters
+(`allp_prefix`, `allp_file` and `ll_doc_path`),
+and `JSON_FILE` is its AST, as produced by `pandoc -t json`.
+For large numbers of documents,
+they may also be listed in a file (`-l`), one per line.
+
+The filters are applied in the order given on the command line.
+Other filter parameters are given the same way as to pandoc,
+and apply to all documents.
+
+Usage example:
+$ for md in $(find . -name "*.md" | sort); do
+      pandoc -f markdown -t json -o "build/${md%.md}.json" "$md"
+      echo "${md#./}=build/${md%.md}.json"
+  done > build/docs.txt
+$ python3 concat_docs.py \
+        -F add_local_link_prefix \
+        -F normalize_links \
+        -F linearize_links \
+        -F shift_headers \
+        -M sh_auto_top_level=2 \
+        -l build/docs.txt \
+        -o combined.json
+$ pandoc -f json -o combined.pdf combined.json
+"""
+
+from _common import check_version, parse_meta_args
+check_version()
+
+import os
+import sys
+import json
+import argparse
+import importlib
+import panflute as pf
+
+# constants
+FILTERS = {
+    'normalize_links': 'NormalizeLinks',
+    'add_local_link_prefix': 'AddLocalLinkPrefix',
+    'linearize_links': 'LinearizeLinks',
+    'shift_headers': 'ShiftHeaders',
+}
+
+def per_file_params(doc_path):
+    """Returns the filter parameters that depend on the documents path."""
+    doc_dir = os.path.dirname(doc_path)
+    return {
+        'allp_prefix': doc_dir + '/' if doc_dir != '' else '',
+        'allp_file': doc_path,
+        'll_doc_path': doc_path,
+    }
+
+def parse_input(input_arg):
+    """Splits a 'DOC_PATH=JSON_FILE' argument into its parts."""
+    doc_path, sep, json_file = input_arg.partition('=')
+    if sep == '' or doc_path == '' or json_file == '':
+        raise ValueError("Invalid input '%s'; expected 'DOC_PATH=JSON_FILE'" % input_arg)
+    return doc_path, json_file
+
+def read_inputs(input_args, list_files):
+    """Yields (doc path, JSON file) pairs from the arguments and list files."""
+    for input_arg in input_args:
+        yield parse_input(input_arg)
+    for list_file in list_files:
+        with (sys.stdin if list_file == '-' else open(list_file, 'r')) as lfh:
+            for line in lfh:
+                line = line.strip()
+                if line != '' and not line.startswith('#'):
+                    yield parse_input(line)
+
+def load_filter_classes(filter_names):
+    """Imports the given filters and returns their classes."""
+    classes = []
+    for filter_name in filter_names:
+        module = importlib.import_module(filter_name)
+        classes.append(getattr(module, FILTERS[filter_name]))
+    return classes
+
+def filter_doc(json_file, doc_path, filter_classes, params):
+    """Loads a single document and applies all filters to it."""
+    with open(json_file, 'r', encoding='utf-8') as ifh:
+        doc = pf.load(ifh)
+    file_params = dict(params)
+    file_params.update(per_file_params(doc_path))
+    for filter_class in filter_classes:
+        doc = filter_class(**file_params).run(doc)
+    return doc
+
+def concat_docs(inputs, filter_classes, params, out_stream):
+    """
+    Filters each of the (doc path, JSON file) inputs in order,
+    and writes their blocks to `out_stream` as a single Pandoc JSON document.
+    """
+    started = False
+    first_block = True
+    for doc_path, json_file in inputs:
+        doc = filter_doc(json_file, doc_path, filter_classes, params)
+        if not started:
+            out_stream.write('{"pandoc-api-version":')
+            json.dump(doc.api_version, out_stream)
+            out_stream.write(',"meta":')
+            json.dump(doc.metadata.content.to_json(), out_stream)
+            out_stream.write(',"blocks":[')
+            started = True
+        for block in doc.content:
+            if not first_block:
+                out_stream.write(',')
+            json.dump(block.to_json(), out_stream, separators=(',', ':'))
+            first_block = False
+    if not started:
+        raise ValueError("No input documents given")
+    out_stream.write(']}\n')
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        description='Concatenates and filters Pandoc JSON documents, streaming.')
+    parser.add_argument('-F', '--filter', dest='filters', action='append',
+                        default=[], choices=list(FILTERS),
+                        help='a filter to apply to each document; may be given multiple times')
+    parser.add_argument('-M', '--metadata', dest='meta', action='append',
+                        default=[], metavar='KEY=VALUE',
+                        help='a filter parameter, like pandoc -M')
+    parser.add_argument('-l', '--list', dest='lists', action='append',
+                        default=[], metavar='FILE',
+                        help='a file listing one DOC_PATH=JSON_FILE per line, or "-" for stdin')
+    parser.add_argument('-o', '--output', default='-',
+                        help='the output file, or "-" for stdout (default)')
+    parser.add_argument('inputs', nargs='*', metavar='DOC_PATH=JSON_FILE',
+                        help='an input document')
+    args = parser.parse_args(argv)
+
+    filter_classes = load_filter_classes(args.filters)
+    params = parse_meta_args(args.meta)
+    inputs = read_inputs(args.inputs, args.lists)
+    if args.output == '-':
+        concat_docs(inputs, filter_classes, params, sys.stdout)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as ofh:
+            concat_docs(inputs, filter_classes, params, ofh)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 Robin Vobruba <hoijui.quaero@gmail.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+This is part of the [MoVeDo](https://github.com/movedo) project.
+See LICENSE.md for copyright information.
+
+Copies all *local* images into a single, flat, content-addressed directory,
+and rewrites all references to them (`pf.Image` and HTML `<img src>`).
+This way, the same image referenced under many different paths,
+or duplicate copies of it in multiple directories,
+end up as a single file, referenced by a single path.
+
+The images are hashed (SHA-256) in parallel, before the document is filtered,
+with each file being read in chunks.
+The hashes are cached in a JSON file, keyed by path, mtime and size,
+so unchanged images are not hashed again in later runs.
+
+It is implemented as a Pandoc filter using panflute.
+
+This might typicaly be used as an intermediate step
+when combining a multitude of documents found within a directory tree
+into a single document at the directory trees root,
+after `add_local_link_prefix.py` and `normalize_links.py`,
+so the image paths are relative to PWD.
+
+Usage example:
+$ pandoc -f markdown -t markdown --markdown-headings=atx \
+        -M ci_asset_dir="assets" \
+        -M ci_cache_file=".image-hashes.json" \
+        -M ci_jobs=8 \
+        --filter consolidate_images.py \
+        -o output.md \
+        input.md
+"""
+
+from _common import check_version, eprint, is_url, is_special_link, is_data_uri, \
+        file_digest, content_addressed_path, default_file_mode, move_into_place, \
+        html_attr_values, html_needs_rewrite, parse_html, Filter
+check_version()
+
+import os
+import re
+import json
+import shutil
+import tempfile
+from urllib.parse import urlsplit, unquote
+from concurrent.futures import ThreadPoolExecutor
+import panflute as pf
+
+def is_local_file_path(url):
+    """Returns True if the argument is a path to a local file."""
+    return not (url == '' or url.startswith('#') or is_data_uri(url)
+                or is_url(url) or is_special_link(url))
+
+def image_file_path(url):
+    """
+    Returns the local file path an image URL refers to,
+    without query and percent-encoding, and the URLs fragment.
+    """
+    parts = urlsplit(url)
+    return unquote(parts.path), parts.fragment
+
+def html_img_srcs(parsed):
+    """Returns all img tags with a src attribute of a parsed piece of HTML."""
+    return parsed.findAll(
+        lambda tag:
+        tag.name == "img" and tag.get("src") is not None)
+
+class DigestCache:
+    """
+    Caches the content digests of files,
+    keyed by path and invalidated by mtime and size.
+    """
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        # path -> [mtime_ns, size, digest]
+        self.entries = {}
+
+    def load(self):
+        """Loads the cache from its file, if it exists."""
+        if self.cache_file and os.path.isfile(self.cache_file):
+            with open(self.cache_file, 'r') as fh:
+                self.entries = json.load(fh)
+
+    def save(self):
+        """Writes the cache to its file."""
+        if self.cache_file:
+            tmp_file = self.cache_file + '.tmp'
+            with open(tmp_file, 'w') as fh:
+                json.dump(self.entries, fh)
+            os.replace(tmp_file, self.cache_file)
+
+    def digest(self, path):
+        """Returns the (possibly cached) digest of a files content."""
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return entry[2]
+        digest = file_digest(key)
+        self.entries[key] = [stat.st_mtime_ns, stat.st_size, digest]
+        return digest
+
+class ConsolidateImages(Filter):
+    """Copies local images into a content-addressed directory."""
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        # parameters
+        self.asset_dir = 'assets'
+        self.jobs = None
+        # state
+        self.cache = DigestCache()
+        # image URL as found in the document -> new URL
+        self.replacements = {}
+
+    def collect_image_urls(self, doc):
+        """Returns all local image URLs referenced in the document."""
+        paths = set()
+
+        def collect(elem, doc):
+            if isinstance(elem, pf.Image) and is_local_file_path(elem.url):
+                paths.add(elem.url)
+            elif isinstance(elem, pf.RawInline) and elem.format == 'html' \
+                    and any(is_local_file_path(src)
+                            for src in html_attr_values(elem.text, ('src',))):
+                parsed = parse_html(elem.text)
+                for img in html_img_srcs(parsed):
+                    if is_local_file_path(img.get("src")):
+                        paths.add(img.get("src"))
+
+        doc.walk(collect)
+        return paths
+
+    def consolidate(self, url):
+        """
+        Copies the image to the asset directory (if not yet there),
+        and returns its new URL, or None if it can not be found.
+        """
+        path, fragment = image_file_path(url)
+        if not os.path.isfile(path):
+            eprint("Image '%s' not found; leaving its references as they are." % url)
+            return None
+        digest = self.cache.digest(path)
+        new_path = content_addressed_path(
+            self.asset_dir, digest, os.path.splitext(path)[1])
+        if not os.path.exists(new_path):
+            tmp_fd, tmp_path = tempfile.mkstemp(dir=self.asset_dir, suffix='.tmp')
+            os.close(tmp_fd)
+            shutil.copyfile(path, tmp_path)
+            move_into_place(tmp_path, new_path)
+        if fragment != '':
+            new_path = new_path + '#' + fragment
+        return new_path
+
+    def replace(self, url):
+        """Returns the consolidated path for an image URL."""
+        new_url = self.replacements.get(url)
+        return url if new_url is None else new_url
+
+    def replace_html(self, elem):
+        """Replaces each img.src URL in a piece of HTML."""
+        if not html_needs_rewrite(elem.text, self.replace, ('src',)):
+            return
+        parsed = parse_html(elem.text)
+        replaced = False
+        for img in html_img_srcs(parsed):
+            new_src = self.replace(img.get("src"))
+            if new_src != img.get("src"):
+                img["src"] = new_src
+                replaced = True
+        if replaced:
+            elem.text = str(parsed)
+            # HACK Remove end-tag automatically inserted by BeautifulSoup as a sanitation matter, see https://stackoverflow.com/questions/57868615/how-to-disable-the-sanitizer-beautifulsoup
+            elem.text = re.sub('></[^>]+>$', '>', elem.text)
+
+    def prepare(self, doc):
+        """The panflute filter init method."""
+        self.asset_dir = self.get_arg(doc, 'ci_asset_dir', 'assets')
+        self.jobs = int(self.get_arg(doc, 'ci_jobs', str(os.cpu_count() or 1)))
+        self.cache = DigestCache(self.get_arg(doc, 'ci_cache_file', ''))
+        self.cache.load()
+        os.makedirs(self.asset_dir, exist_ok=True)
+        # read the umask before the copying threads need it
+        default_file_mode()
+        urls = sorted(self.collect_image_urls(doc))
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            new_urls = list(executor.map(self.consolidate, urls))
+        self.replacements = {
+            url: new_url
+            for url, new_url in zip(urls, new_urls)
+            if new_url is not None}
+
+    def action(self, elem, doc):
+        """The panflute filter main method, called once per element."""
+        if isinstance(elem, pf.Image):
+            elem.url = self.replace(elem.url)
+        if isinstance(elem, pf.RawInline) and elem.format == 'html':
+            self.replace_html(elem)
+        return elem
+
+    def finalize(self, doc):
+        """The panflute filter "destructor" method."""
+        self.cache.save()
+
+def main(doc=None):
+    """
+    NOTE: The main function has to be exactly like this
+    if we want to be able to run filters automatically
+    with '-F panflute'
+    """
+    return ConsolidateImages().run(doc)
+
+if __name__ == '__main__':
+    main()
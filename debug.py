@@ -19,13 +19,12 @@ $ pandoc -f markdown -t markdown --markdown-headings=atx \
 import sys
 import json
 import pprint
-import pkg_resources
 
 import panflute as pf
 
 def action(elem, doc):
     if isinstance(elem, pf.Doc):
-        version = pkg_resources.get_distribution("panflute").version
+        version = pf.__version__
         json_serializer = lambda elem: elem.to_json()
         raw = json.dumps(elem, default=json_serializer)
         raw = json.loads(raw)
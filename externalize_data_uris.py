@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 Robin Vobruba <hoijui.quaero@gmail.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+This is part of the [MoVeDo](https://github.com/movedo) project.
+See LICENSE.md for copyright information.
+
+Replaces "data:*" URIs in links and images
+(including HTML `<a href>` and `<img src>`)
+with short, relative paths to files containing the decoded data.
+
+Each URI is decoded once, and written to a content-addressed file
+(named by the SHA-256 of its content) in a flat asset directory,
+so identical data ends up in a single file.
+This shrinks the AST every downstream filter and pandoc itsself has to handle,
+by up to the full size of the embedded (base64 encoded) data.
+
+It is implemented as a Pandoc filter using panflute.
+
+This might typicaly be used as the first step
+when combining a multitude of documents into a single one,
+before `add_local_link_prefix.py`, `linearize_links.py` and so on.
+
+Usage example:
+$ pandoc -f markdown -t markdown --markdown-headings=atx \
+        -M edu_asset_dir="assets" \
+        --filter externalize_data_uris.py \
+        -o output.md \
+        input.md
+"""
+
+from _common import check_version, eprint, is_data_uri, content_addressed_path, \
+        move_into_place, html_needs_rewrite, parse_html, Filter
+check_version()
+
+import os
+import re
+import base64
+import binascii
+import hashlib
+import tempfile
+import mimetypes
+from urllib.parse import unquote_to_bytes
+import panflute as pf
+
+# constants
+DEFAULT_MEDIA_TYPE = 'text/plain'
+DEFAULT_SUFFIX = '.bin'
+
+def decode_data_uri(uri):
+    """
+    Decodes a "data:[<media type>][;base64],<data>" URI,
+    returning the media type and the data.
+    """
+    header, sep, data = uri[len('data:'):].partition(',')
+    if sep == '':
+        raise ValueError("Invalid data URI, missing ',': '%s...'" % uri[:64])
+    params = header.split(';')
+    media_type = params[0].strip().lower() or DEFAULT_MEDIA_TYPE
+    if params[-1].strip().lower() == 'base64':
+        # reject (instead of silently dropping) characters outside the base64 alphabet
+        content = base64.b64decode(re.sub(r'\s+', '', data), validate=True)
+    else:
+        content = unquote_to_bytes(data)
+    return media_type, content
+
+def media_type_suffix(media_type):
+    """Returns the file suffix for a media type, e.g. '.png' for 'image/png'."""
+    return mimetypes.guess_extension(media_type) or DEFAULT_SUFFIX
+
+class ExternalizeDataUris(Filter):
+    """Writes data URIs to content-addressed files and links to those instead."""
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        # parameters
+        self.asset_dir = 'assets'
+        # state
+        # data URI -> path of the file with its content
+        self.paths = {}
+
+    def externalize(self, url):
+        """
+        If the URL is a data URI, writes its content to a file
+        (if not yet there), and returns the files path instead.
+        """
+        if not is_data_uri(url):
+            return url
+        path = self.paths.get(url)
+        if path is None:
+            path = self.write_data(url)
+            self.paths[url] = path
+        return path
+
+    def write_data(self, url):
+        """
+        Decodes a data URI and writes its content to a content-addressed file,
+        returning its path, or the URI itsself if it is invalid.
+        """
+        try:
+            media_type, content = decode_data_uri(url)
+        except (ValueError, binascii.Error) as exc:
+            eprint("Leaving invalid data URI '%s...' as it is: %s" % (url[:64], exc))
+            return url
+        digest = hashlib.sha256(content).hexdigest()
+        path = content_addressed_path(self.asset_dir, digest, media_type_suffix(media_type))
+        if not os.path.exists(path):
+            tmp_fd, tmp_path = tempfile.mkstemp(dir=self.asset_dir, suffix='.tmp')
+            with os.fdopen(tmp_fd, 'wb') as ofh:
+                ofh.write(content)
+            move_into_place(tmp_path, path)
+        return path
+
+    def externalize_html(self, elem):
+        """Externalizes each a.href and img.src data URI in a piece of HTML."""
+        if not html_needs_rewrite(elem.text, self.externalize):
+            return
+        parsed = parse_html(elem.text)
+        replaced = False
+        anchors_with_href = parsed.findAll(
+            lambda tag:
+            tag.name == "a" and tag.get("href") is not None)
+        for anchor in anchors_with_href:
+            new_href = self.externalize(anchor.get("href"))
+            if new_href != anchor.get("href"):
+                anchor["href"] = new_href
+                replaced = True
+        imgs_with_src = parsed.findAll(
+            lambda tag:
+            tag.name == "img" and tag.get("src") is not None)
+        for img in imgs_with_src:
+            new_src = self.externalize(img.get("src"))
+            if new_src != img.get("src"):
+                img["src"] = new_src
+                replaced = True
+        if replaced:
+            elem.text = str(parsed)
+            # HACK Remove end-tag automatically inserted by BeautifulSoup as a sanitation matter, see https://stackoverflow.com/questions/57868615/how-to-disable-the-sanitizer-beautifulsoup
+            elem.text = re.sub('></[^>]+>$', '>', elem.text)
+
+    def prepare(self, doc):
+        """The panflute filter init method."""
+        self.asset_dir = self.get_arg(doc, 'edu_asset_dir', 'assets')
+        self.paths = {}
+        os.makedirs(self.asset_dir, exist_ok=True)
+
+    def action(self, elem, doc):
+        """The panflute filter main method, called once per element."""
+        if isinstance(elem, (pf.Link, pf.Image)):
+            elem.url = self.externalize(elem.url)
+        if isinstance(elem, pf.RawInline) and elem.format == 'html':
+            self.externalize_html(elem)
+        return elem
+
+def main(doc=None):
+    """
+    NOTE: The main function has to be exactly like this
+    if we want to be able to run filters automatically
+    with '-F panflute'
+    """
+    return ExternalizeDataUris().run(doc)
+
+if __name__ == '__main__':
+    main()
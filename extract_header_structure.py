@@ -25,7 +25,7 @@ $ pandoc -f markdown -t markdown --markdown-headings=atx \
         input.md
 """
 
-from _common import check_version, eprint, get_arg
+from _common import check_version, Filter
 check_version()
 
 import panflute as pf
@@ -36,47 +36,52 @@ MIN_LEVEL = 1
 MAX_LEVEL = 6
 MAX_LEVEL = 10
 
-# parameters
-# how many instances of each header level we encountered
-counters = []
-output_file = ''
-ofh = None
-
-def prepare(doc):
-    """The panflute filter init method."""
-    global counters, output_file, ofh
-    for _ in range(MIN_LEVEL, MAX_LEVEL):
-        counters.append(0)
-    output_file = get_arg(doc, 'ehs_output_file')
-    ofh = open(output_file, "w")
-
-def action(elem, doc):
-    """The panflute filter main method, called once per element."""
-    global counters
-    if isinstance(elem, pf.Header):
-        lvl = elem.level - MIN_LEVEL
-        counters[lvl] = counters[lvl] + 1
-        ofh.write('%d %s\n' % (lvl + 1, elem.identifier))
-    return elem
-
-def finalize(doc):
-    """The panflute filter "destructor" method."""
-    ofh.write('####\n')
-    total = 0
-    min_l = 999
-    max_l = 0
-    for lvl in range(MIN_LEVEL, MAX_LEVEL):
-        cnt = counters[lvl - MIN_LEVEL]
-        total += cnt
-        if lvl > max_l and cnt > 0:
-            max_l = lvl
-        if lvl < min_l and cnt > 0:
-            min_l = lvl
-        ofh.write('# %s: %d\n' % (("Headers of level %d" % (MIN_LEVEL + lvl)), cnt))
-    ofh.write('# %s: %d\n' % ("Total headers", total))
-    ofh.write('# %s: %d\n' % ("Min header level", min_l))
-    ofh.write('# %s: %d\n' % ("Max header level", max_l))
-    ofh.close()
+class ExtractHeaderStructure(Filter):
+    """Extracts the headers and statistics about them into a file."""
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        # parameters
+        self.output_file = ''
+        # state
+        # how many instances of each header level we encountered
+        self.counters = []
+        self.ofh = None
+
+    def prepare(self, doc):
+        """The panflute filter init method."""
+        self.counters = [0 for _ in range(MIN_LEVEL, MAX_LEVEL)]
+        self.output_file = self.get_arg(doc, 'ehs_output_file')
+        self.ofh = open(self.output_file, "w")
+
+    def action(self, elem, doc):
+        """The panflute filter main method, called once per element."""
+        if isinstance(elem, pf.Header):
+            lvl = elem.level - MIN_LEVEL
+            self.counters[lvl] = self.counters[lvl] + 1
+            self.ofh.write('%d %s\n' % (lvl + 1, elem.identifier))
+        return elem
+
+    def finalize(self, doc):
+        """The panflute filter "destructor" method."""
+        ofh = self.ofh
+        ofh.write('####\n')
+        total = 0
+        min_l = 999
+        max_l = 0
+        for lvl in range(MIN_LEVEL, MAX_LEVEL):
+            cnt = self.counters[lvl - MIN_LEVEL]
+            total += cnt
+            if lvl > max_l and cnt > 0:
+                max_l = lvl
+            if lvl < min_l and cnt > 0:
+                min_l = lvl
+            ofh.write('# %s: %d\n' % (("Headers of level %d" % (MIN_LEVEL + lvl)), cnt))
+        ofh.write('# %s: %d\n' % ("Total headers", total))
+        ofh.write('# %s: %d\n' % ("Min header level", min_l))
+        ofh.write('# %s: %d\n' % ("Max header level", max_l))
+        ofh.close()
+        self.ofh = None
 
 def main(doc=None):
     """
@@ -84,11 +89,7 @@ def main(doc=None):
     if we want to be able to run filters automatically
     with '-F panflute'
     """
-    return pf.run_filter(
-        action,
-        prepare=prepare,
-        finalize=finalize,
-        doc=doc)
+    return ExtractHeaderStructure().run(doc)
 
 if __name__ == '__main__':
     main()
@@ -20,28 +20,30 @@ $ pandoc -f markdown -t markdown --markdown-headings=atx \
         input.md
 """
 
-from _common import check_version, get_arg
+from _common import check_version, Filter
 check_version()
 
 import panflute as pf
 
-# parameters
-# should eventually be a value between 1 and 10
-max_level = 0
+class HeaderPagebreaks(Filter):
+    """Adds page-breaks before headers of a certain level or lower."""
 
-def prepare(doc):
-    """The panflute filter init method."""
-    global max_level
-    max_level = int(get_arg(doc, 'hp_max_level', '2'))
+    def __init__(self, **params):
+        super().__init__(**params)
+        # parameters
+        # should eventually be a value between 1 and 10
+        self.max_level = 0
 
-def action(elem, doc):
-    if isinstance(elem, pf.Header) and elem.level <= max_level:
-        pagebreak = pf.RawBlock('\\pagebreak{}', format='latex')
-        return [pagebreak, elem]
+    def prepare(self, doc):
+        """The panflute filter init method."""
+        self.max_level = int(self.get_arg(doc, 'hp_max_level', '2'))
 
-def finalize(doc):
-    """The panflute filter "destructor" method."""
-    pass
+    def action(self, elem, doc):
+        """The panflute filter main method, called once per element."""
+        if isinstance(elem, pf.Header) and elem.level <= self.max_level:
+            pagebreak = pf.RawBlock('\\pagebreak{}', format='latex')
+            return [pagebreak, elem]
+        return None
 
 def main(doc=None):
     """
@@ -49,11 +51,7 @@ def main(doc=None):
     if we want to be able to run filters automatically
     with '-F panflute'
     """
-    return pf.run_filter(
-        action,
-        prepare=prepare,
-        finalize=finalize,
-        doc=doc)
+    return HeaderPagebreaks().run(doc)
 
 if __name__ == '__main__':
     main()
@@ -42,21 +42,30 @@ into a single document at the directory trees root.
 Or more pracitcally: when creating a single PDF
 out of a bunch of Markdown or HTML files scatered around the filesystem.
 
+Identical link targets share a single string object in memory.
+If `ll_ref_links` is True and the output format is Markdown,
+links are written in reference style (`[text][ref]`),
+with one reference definition per distinct target (and title)
+in a table at the end of the document,
+so repeated targets appear only once in the output.
+The reference labels are prefixed with the documents identifier,
+so they stay unique when multiple outputs get combined.
+
 Usage example:
 $ pandoc -f markdown -t markdown --markdown-headings=atx \
         -M ll_doc_path="dir/to/input.md" \
+        -M ll_ref_links=True \
         --filter linearize_links.py \
         -o "other-dir/to/output.md" \
         "dir/to/input.md"
 """
 
-from _common import check_version, is_rel_path, get_arg
+from _common import check_version, is_rel_path, is_data_uri, \
+        html_needs_rewrite, parse_html, Filter
 check_version()
 
 import re
 import panflute as pf
-# TODO Instead of bs4/BeautifulSoup for parsing HTML, use pandoc itsself - panflute has functions for that, see its docu
-from bs4 import BeautifulSoup
 
 # constants
 REGEX_REF_DELETER = re.compile(r'#.*$')
@@ -65,110 +74,172 @@ REGEX_SUFFIX = re.compile(r'\.[^.]*$')
 REGEX_BACK_REF = re.compile(r'(\.\./)')
 REGEX_NON_REF = re.compile(r'[^a-z0-9_-]')
 REGEX_NON_ALPHA_FIRST = re.compile(r'^([^a-zA-Z])')
-
-# parameters
-# relative path to the document currently being processed
-doc_path = '<DEFAULT_DOC_PATH>'
-id_prefix = ''
-
-def linearize_link_path(link_path):
-    """
-    Converts a path+reference string to a reference only.
-    NOTE: References/anchors/fragments *must* start
-          with a character in '[a-zA-Z]';
-          thus we add an 'X' in front if they do not.
-    Examples:
-    * dir/file.md#some-ref -> dir-file-some-ref
-    * dir/file.md -> dir-file
-    * #some-ref -> some-ref
-    """
-    global id_prefix
-    path = re.sub(REGEX_REF_DELETER, '', link_path)
-    ref = re.sub(REGEX_PATH_DELETER, '', link_path)
-    if ref == link_path:
-        ref = None
-    if path == '':
-        path = id_prefix
-    else:
-        path = path.lower()
-        path = re.sub(REGEX_SUFFIX, '', path)
-        path = re.sub(REGEX_BACK_REF, '_/', path)
-        path = re.sub(REGEX_NON_REF, '-', path)
-        path = re.sub(REGEX_NON_ALPHA_FIRST, r'X\1', path)
-    if ref is not None:
-        if path != '':
-            path = path + '-'
-        path = path + ref
-    return path
-
-def linearize_url(elem):
-    """Linearizes a URL if it is a local path."""
-    if is_rel_path(elem.url):
-        elem.url = '#' + linearize_link_path(elem.url)
-
-def linearize_identifier(ident):
-    """Prepends the reference-formatted relative file-path to the supplied identifier."""
-    global id_prefix
-    if id_prefix != '':
-        if ident != '':
-            ident = '-' + ident
-        ident = id_prefix + ident
-    return ident
-
-def linearize_identifier_elem(elem):
-    """Prepends the reference-formatted relative file-path to the supplied elements identifier."""
-    elem.identifier = linearize_identifier(elem.identifier)
-
-def linearize_html_anchor(elem):
-    """Prepends the reference-formatted relative file path to the identifier."""
-    parsed = BeautifulSoup(elem.text, 'html.parser')
-    replaced = False
-    # Replace anchors (links)
-    anchors_with_href = parsed.findAll(
-        lambda tag:
-        tag.name == "a" and tag.get("href") is not None)
-    for anchor in anchors_with_href:
-        new_href = '#' + linearize_link_path(anchor.get("href"))
-        if new_href != anchor.get("href"):
-            anchor["href"] = new_href
-            replaced = True
-    # Replace names (References/Identifiers)
-    anchors_with_name = parsed.findAll(
-        lambda tag:
-        tag.name == "a" and tag.get("name") is not None)
-    for anchor in anchors_with_name:
-        new_name = linearize_identifier(anchor.get("name"))
-        if new_name != anchor.get("name"):
-            anchor["name"] = new_name
-            replaced = True
-    if replaced:
-        elem.text = str(parsed)
-        # HACK Remove end-tag automatically inserted by BeautifulSoup as a sanitation matter, see https://stackoverflow.com/questions/57868615/how-to-disable-the-sanitizer-beautifulsoup
-        elem.text = re.sub('></[^>]+>$', '>', elem.text)
-
-def prepare(doc):
-    """The panflute filter init method."""
-    global doc_path, id_prefix
-    doc_path = get_arg(doc, 'll_doc_path')
-    id_prefix = linearize_link_path(doc_path)
-    # Add reference for the whole file at the top
-    if id_prefix != '':
-        # empty here, because the id_prefix will be added later in action()
-        doc.content.insert(0, pf.Para(pf.RawInline('<a name=""/>')))
-
-def action(elem, doc):
-    """The panflute filter main method, called once per element."""
-    if isinstance(elem, pf.Link):
-        linearize_url(elem)
-    if hasattr(elem, 'identifier') and elem.identifier != '':
-        linearize_identifier_elem(elem)
-    if isinstance(elem, pf.RawInline) and elem.format == 'html':
-        linearize_html_anchor(elem)
-    return elem
-
-def finalize(doc):
-    """The panflute filter "destructor" method."""
-    pass
+REGEX_NEEDS_ANGLE_BRACKETS = re.compile(r'[\s()<>]')
+MARKDOWN_FORMATS = ('markdown', 'markdown_strict', 'markdown_phpextra',
+                    'markdown_mmd', 'markdown_github', 'gfm', 'commonmark', 'commonmark_x')
+
+def output_format_name(doc_format):
+    """Returns the output format without extensions, e.g. 'gfm' for 'gfm+smart'."""
+    return re.split(r'[+-]', doc_format, 1)[0]
+
+def ref_definition(label, url, title):
+    """Returns a Markdown reference link definition."""
+    if url == '' or re.search(REGEX_NEEDS_ANGLE_BRACKETS, url):
+        url = '<' + url + '>'
+    if title != '':
+        url = url + ' "' + title.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return '[%s]: %s' % (label, url)
+
+class LinearizeLinks(Filter):
+    """Converts local links and identifiers to document-wide unique references."""
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        # parameters
+        # relative path to the document currently being processed
+        self.doc_path = '<DEFAULT_DOC_PATH>'
+        self.id_prefix = ''
+        self.ref_links = False
+        # the (base) output format, if it is a Markdown one
+        self.ref_format = None
+        # state
+        # each distinct URL string, to share a single instance of it
+        self.interned_urls = {}
+        # (url, title) -> reference label, in order of appearance
+        self.ref_labels = {}
+
+    def linearize_link_path(self, link_path):
+        """
+        Converts a path+reference string to a reference only.
+        NOTE: References/anchors/fragments *must* start
+              with a character in '[a-zA-Z]';
+              thus we add an 'X' in front if they do not.
+        Examples:
+        * dir/file.md#some-ref -> dir-file-some-ref
+        * dir/file.md -> dir-file
+        * #some-ref -> some-ref
+        """
+        path = re.sub(REGEX_REF_DELETER, '', link_path)
+        ref = re.sub(REGEX_PATH_DELETER, '', link_path)
+        if ref == link_path:
+            ref = None
+        if path == '':
+            path = self.id_prefix
+        else:
+            path = path.lower()
+            path = re.sub(REGEX_SUFFIX, '', path)
+            path = re.sub(REGEX_BACK_REF, '_/', path)
+            path = re.sub(REGEX_NON_REF, '-', path)
+            path = re.sub(REGEX_NON_ALPHA_FIRST, r'X\1', path)
+        if ref is not None:
+            if path != '':
+                path = path + '-'
+            path = path + ref
+        return path
+
+    def linearize_url(self, elem):
+        """Linearizes a URL if it is a local path."""
+        if is_rel_path(elem.url):
+            elem.url = '#' + self.linearize_link_path(elem.url)
+        elem.url = self.interned_urls.setdefault(elem.url, elem.url)
+
+    def to_ref_link(self, elem):
+        """
+        Converts a link into a reference style one,
+        returning the inlines replacing it.
+        """
+        key = (elem.url, elem.title)
+        label = self.ref_labels.get(key)
+        if label is None:
+            label = self.linearize_identifier('ref-%d' % (len(self.ref_labels) + 1))
+            self.ref_labels[key] = label
+        return ([pf.RawInline('[', format=self.ref_format)]
+                + list(elem.content)
+                + [pf.RawInline('][%s]' % label, format=self.ref_format)])
+
+    def linearize_href(self, href):
+        """Linearizes the href of an HTML anchor, unless it is a data URI."""
+        if is_data_uri(href):
+            return href
+        return '#' + self.linearize_link_path(href)
+
+    def linearize_identifier(self, ident):
+        """Prepends the reference-formatted relative file-path to the supplied identifier."""
+        if self.id_prefix != '':
+            if ident != '':
+                ident = '-' + ident
+            ident = self.id_prefix + ident
+        return ident
+
+    def linearize_identifier_elem(self, elem):
+        """Prepends the reference-formatted relative file-path to the supplied elements identifier."""
+        elem.identifier = self.linearize_identifier(elem.identifier)
+
+    def linearize_html_anchor(self, elem):
+        """Prepends the reference-formatted relative file path to the identifier."""
+        if not (html_needs_rewrite(elem.text, self.linearize_href, ('href',))
+                or html_needs_rewrite(elem.text, self.linearize_identifier, ('name',))):
+            return
+        parsed = parse_html(elem.text)
+        replaced = False
+        # Replace anchors (links)
+        anchors_with_href = parsed.findAll(
+            lambda tag:
+            tag.name == "a" and tag.get("href") is not None)
+        for anchor in anchors_with_href:
+            new_href = self.linearize_href(anchor.get("href"))
+            if new_href != anchor.get("href"):
+                anchor["href"] = new_href
+                replaced = True
+        # Replace names (References/Identifiers)
+        anchors_with_name = parsed.findAll(
+            lambda tag:
+            tag.name == "a" and tag.get("name") is not None)
+        for anchor in anchors_with_name:
+            new_name = self.linearize_identifier(anchor.get("name"))
+            if new_name != anchor.get("name"):
+                anchor["name"] = new_name
+                replaced = True
+        if replaced:
+            elem.text = str(parsed)
+            # HACK Remove end-tag automatically inserted by BeautifulSoup as a sanitation matter, see https://stackoverflow.com/questions/57868615/how-to-disable-the-sanitizer-beautifulsoup
+            elem.text = re.sub('></[^>]+>$', '>', elem.text)
+
+    def prepare(self, doc):
+        """The panflute filter init method."""
+        self.doc_path = self.get_arg(doc, 'll_doc_path')
+        self.ref_links = self.get_arg(doc, 'll_ref_links', 'False') == 'True'
+        out_format = output_format_name(doc.format)
+        self.ref_format = out_format if out_format in MARKDOWN_FORMATS else None
+        self.interned_urls = {}
+        self.ref_labels = {}
+        self.id_prefix = ''
+        self.id_prefix = self.linearize_link_path(self.doc_path)
+        # Add reference for the whole file at the top
+        if self.id_prefix != '':
+            # empty here, because the id_prefix will be added later in action()
+            doc.content.insert(0, pf.Para(pf.RawInline('<a name=""/>')))
+
+    def action(self, elem, doc):
+        """The panflute filter main method, called once per element."""
+        if isinstance(elem, pf.Link):
+            self.linearize_url(elem)
+        if hasattr(elem, 'identifier') and elem.identifier != '':
+            self.linearize_identifier_elem(elem)
+        if isinstance(elem, pf.RawInline) and elem.format == 'html':
+            self.linearize_html_anchor(elem)
+        if isinstance(elem, pf.Link) and self.ref_links and self.ref_format is not None \
+                and elem.identifier == '' and not elem.classes and not elem.attributes:
+            return self.to_ref_link(elem)
+        return elem
+
+    def finalize(self, doc):
+        """The panflute filter "destructor" method."""
+        if self.ref_labels:
+            doc.content.append(pf.RawBlock(
+                '\n'.join(ref_definition(label, url, title)
+                          for (url, title), label in self.ref_labels.items()),
+                format=self.ref_format))
 
 def main(doc=None):
     """
@@ -176,11 +247,7 @@ def main(doc=None):
     if we want to be able to run filters automatically
     with '-F panflute'
     """
-    return pf.run_filter(
-        action,
-        prepare=prepare,
-        finalize=finalize,
-        doc=doc)
+    return LinearizeLinks().run(doc)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 Robin Vobruba <hoijui.quaero@gmail.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+This is part of the [MoVeDo](https://github.com/movedo) project.
+See LICENSE.md for copyright information.
+
+Bundles all the filters (and tools) into a single, executable zipapp,
+containing their pre-compiled bytecode (and sources, as fallback),
+so they start up without parsing or compiling anything.
+NOTE The bytecode is specific to the Python version used to create the bundle.
+
+The filter to run is chosen by the name the bundle is invoked under,
+so one may create a symlink per filter,
+or by the `MOVEDO_FILTER` environment variable,
+or - for the command line tools - by the first argument.
+After creating the bundle, it is run once as a smoke test,
+failing loudly if it does not even start.
+
+Usage example:
+$ python3 make_bundle.py -o movedo-filters.pyz
+$ ln -s movedo-filters.pyz normalize_links
+$ pandoc -f markdown -t markdown --markdown-headings=atx \
+        --filter ./normalize_links \
+        -o output.md \
+        input.md
+$ python3 movedo-filters.pyz rewrite_md_links -F normalize_links input.md
+"""
+
+from _common import check_version
+check_version()
+
+import os
+import sys
+import stat
+import argparse
+import zipfile
+import subprocess
+
+# constants
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+# modules to include in the bundle; all but the private ones can be run
+MODULES = [
+    '_common',
+    'add_local_link_prefix',
+    'ast_cache',
+    'check_urls',
+    'concat_docs',
+    'consolidate_images',
+    'debug',
+    'externalize_data_uris',
+    'extract_header_structure',
+    'header_pagebreaks',
+    'linearize_links',
+    'normalize_links',
+    'replace_link_suffixes',
+    'rewrite_md_links',
+    'shift_headers',
+]
+INTERPRETER = '/usr/bin/env python3'
+MAIN_TEMPLATE = '''\
+import os
+import sys
+import importlib
+
+MODULES = %r
+
+def select_module():
+    name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    if name in MODULES:
+        return name
+    name = os.environ.get('MOVEDO_FILTER')
+    if name in MODULES:
+        return name
+    if len(sys.argv) > 1 and sys.argv[1] in MODULES:
+        return sys.argv.pop(1)
+    sys.exit("Please choose one of: %%s" %% ', '.join(MODULES))
+
+importlib.import_module(select_module()).main()
+'''
+# arguments for a smoke run of the bundle,
+# which runs its `__main__` and a module that needs no input
+SMOKE_TEST_ARGS = ['rewrite_md_links', '--help']
+
+def make_bundle(output_file, optimize=-1):
+    """Writes the zipapp bundle to `output_file`."""
+    runnable = [module for module in MODULES if not module.startswith('_')]
+    with open(output_file, 'wb') as ofh:
+        ofh.write(('#!%s\n' % INTERPRETER).encode('utf-8'))
+        with zipfile.PyZipFile(ofh, 'w', compression=zipfile.ZIP_DEFLATED,
+                               optimize=optimize) as bundle:
+            for module in MODULES:
+                src_file = os.path.join(SRC_DIR, module + '.py')
+                bundle.writepy(src_file)
+                bundle.write(src_file, module + '.py')
+            bundle.writestr('__main__.py', MAIN_TEMPLATE % runnable)
+    mode = os.stat(output_file).st_mode
+    os.chmod(output_file, mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+def check_bundle(bundle_file):
+    """Runs the bundle once, raising an error if it fails to start."""
+    result = subprocess.run([sys.executable, bundle_file] + SMOKE_TEST_ARGS,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError("The bundle '%s' fails to run:\n%s"
+                           % (bundle_file, result.stderr.decode('utf-8', 'replace')))
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        description='Bundles all filters into a single executable zipapp.')
+    parser.add_argument('-o', '--output', default='movedo-filters.pyz',
+                        help='the bundle file to create (default: %(default)s)')
+    parser.add_argument('-O', '--optimize', type=int, default=-1, choices=[-1, 0, 1, 2],
+                        help='the bytecode optimization level, like python -O (default: that of this interpreter)')
+    args = parser.parse_args(argv)
+    make_bundle(args.output, args.optimize)
+    check_bundle(args.output)
+
+if __name__ == '__main__':
+    main()
@@ -33,68 +33,68 @@ $ pandoc -f markdown -t markdown --markdown-headings=atx \
         input.md
 """
 
-from _common import check_version, is_url
+from _common import check_version, is_url, is_data_uri, \
+        html_needs_rewrite, parse_html, Filter
 check_version()
 
 import os
 import re
 import panflute as pf
-# TODO Instead of bs4/BeautifulSoup for parsing HTML, use pandoc itsself - panflute has functions for that, see its docu
-from bs4 import BeautifulSoup
 
 def normalize(url):
     """Normalize a URL string."""
     norm_url = url
-    if not is_url(url):
+    if not (is_url(url) or is_data_uri(url)):
         norm_url = os.path.normpath(url)
     return norm_url
 
-def normalize_url(elem):
-    """Normalize the elem.url."""
-    elem.url = normalize(elem.url)
-
-def normalize_html_link_or_image(elem):
-    """Normalizes each a.href and img.src URL in a piece of HTML."""
-    parsed = BeautifulSoup(elem.text, 'html.parser')
-    replaced = False
-    # Normalize anchors (links)
-    anchors_with_href = parsed.findAll(
-        lambda tag:
-        tag.name == "a" and tag.get("href") is not None)
-    for anchor in anchors_with_href:
-        new_href = normalize(anchor.get("href"))
-        if new_href != anchor.get("href"):
-            anchor["href"] = new_href
-            replaced = True
-    # Normalize images
-    imgs_with_src = parsed.findAll(
-        lambda tag:
-        tag.name == "img" and tag.get("src") is not None)
-    for img in imgs_with_src:
-        new_src = normalize(img.get("src"))
-        if new_src != img.get("src"):
-            img["src"] = new_src
-            replaced = True
-    if replaced:
-        elem.text = str(parsed)
-        # HACK Remove end-tag automatically inserted by BeautifulSoup as a sanitation matter, see https://stackoverflow.com/questions/57868615/how-to-disable-the-sanitizer-beautifulsoup
-        elem.text = re.sub('></[^>]+>$', '>', elem.text)
-
-def prepare(doc):
-    """The panflute filter init method."""
-    pass
-
-def action(elem, doc):
-    """The panflute filter main method, called once per element."""
-    if isinstance(elem, (pf.Link, pf.Image)):
-        normalize_url(elem)
-    if isinstance(elem, pf.RawInline) and elem.format == 'html':
-        normalize_html_link_or_image(elem)
-    return elem
-
-def finalize(doc):
-    """The panflute filter "destructor" method."""
-    pass
+class NormalizeLinks(Filter):
+    """Normalizes local paths in links and images."""
+
+    def normalize(self, url):
+        """Normalize a URL string."""
+        return normalize(url)
+
+    def normalize_url(self, elem):
+        """Normalize the elem.url."""
+        elem.url = self.normalize(elem.url)
+
+    def normalize_html_link_or_image(self, elem):
+        """Normalizes each a.href and img.src URL in a piece of HTML."""
+        if not html_needs_rewrite(elem.text, self.normalize):
+            return
+        parsed = parse_html(elem.text)
+        replaced = False
+        # Normalize anchors (links)
+        anchors_with_href = parsed.findAll(
+            lambda tag:
+            tag.name == "a" and tag.get("href") is not None)
+        for anchor in anchors_with_href:
+            new_href = self.normalize(anchor.get("href"))
+            if new_href != anchor.get("href"):
+                anchor["href"] = new_href
+                replaced = True
+        # Normalize images
+        imgs_with_src = parsed.findAll(
+            lambda tag:
+            tag.name == "img" and tag.get("src") is not None)
+        for img in imgs_with_src:
+            new_src = self.normalize(img.get("src"))
+            if new_src != img.get("src"):
+                img["src"] = new_src
+                replaced = True
+        if replaced:
+            elem.text = str(parsed)
+            # HACK Remove end-tag automatically inserted by BeautifulSoup as a sanitation matter, see https://stackoverflow.com/questions/57868615/how-to-disable-the-sanitizer-beautifulsoup
+            elem.text = re.sub('></[^>]+>$', '>', elem.text)
+
+    def action(self, elem, doc):
+        """The panflute filter main method, called once per element."""
+        if isinstance(elem, (pf.Link, pf.Image)):
+            self.normalize_url(elem)
+        if isinstance(elem, pf.RawInline) and elem.format == 'html':
+            self.normalize_html_link_or_image(elem)
+        return elem
 
 def main(doc=None):
     """
@@ -102,11 +102,7 @@ def main(doc=None):
     if we want to be able to run filters automatically
     with '-F panflute'
     """
-    return pf.run_filter(
-        action,
-        prepare=prepare,
-        finalize=finalize,
-        doc=doc)
+    return NormalizeLinks().run(doc)
 
 if __name__ == '__main__':
     main()
@@ -26,7 +26,7 @@ $ pandoc -f markdown -t markdown --markdown-headings=atx \
         input.md
 """
 
-from _common import check_version, is_rel_path, get_arg
+from _common import check_version, is_rel_path, Filter
 check_version()
 
 import re
@@ -36,42 +36,42 @@ import panflute as pf
 REGEX_REF_DELETER = re.compile(r'#.*$')
 REGEX_PATH_DELETER = re.compile(r'^.*#')
 
-# parameters
-relative_only = True
-ext_from = '.<unset_ext_from>'
-ext_to = '.<unset_ext_to>'
-
-def prepare(doc):
-    """The panflute filter init method."""
-    global relative_only, ext_from, ext_to
-    relative_only = get_arg(doc, 'rls_relative_only', 'True') == 'True'
-    ext_from = get_arg(doc, 'rls_ext_from')
-    ext_to = get_arg(doc, 'rls_ext_to')
-
-def replace_link_suffix(url):
-    """If the URL fits, we replace the file suffix."""
-    if not is_rel_path(url) and relative_only:
+class ReplaceLinkSuffixes(Filter):
+    """Replaces the file extensions/suffixes of certain links."""
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        # parameters
+        self.relative_only = True
+        self.ext_from = '.<unset_ext_from>'
+        self.ext_to = '.<unset_ext_to>'
+
+    def prepare(self, doc):
+        """The panflute filter init method."""
+        self.relative_only = self.get_arg(doc, 'rls_relative_only', 'True') == 'True'
+        self.ext_from = self.get_arg(doc, 'rls_ext_from')
+        self.ext_to = self.get_arg(doc, 'rls_ext_to')
+
+    def replace_link_suffix(self, url):
+        """If the URL fits, we replace the file suffix."""
+        if not is_rel_path(url) and self.relative_only:
+            return url
+        path = re.sub(REGEX_REF_DELETER, '', url)
+        ref = re.sub(REGEX_PATH_DELETER, '', url)
+        if ref == url:
+            ref = None
+        if path.endswith(self.ext_from):
+            url = path[:-len(self.ext_from)] + self.ext_to
+            if ref is not None:
+                url = url + '#' + ref
         return url
-    path = re.sub(REGEX_REF_DELETER, '', url)
-    ref = re.sub(REGEX_PATH_DELETER, '', url)
-    if ref == url:
-        ref = None
-    if path.endswith(ext_from):
-        url = path[:-len(ext_from)] + ext_to
-        if ref is not None:
-            url = url + '#' + ref
-    return url
-
-def action(elem, doc):
-    """The panflute filter main method, called once per element."""
-    if isinstance(elem, pf.Link):
-        elem.url = replace_link_suffix(elem.url)
-    # TODO Also do this with HTML links (using BeautifulSoup, see other filters)
-    return elem
-
-def finalize(doc):
-    """The panflute filter "destructor" method."""
-    pass
+
+    def action(self, elem, doc):
+        """The panflute filter main method, called once per element."""
+        if isinstance(elem, pf.Link):
+            elem.url = self.replace_link_suffix(elem.url)
+        # TODO Also do this with HTML links (using BeautifulSoup, see other filters)
+        return elem
 
 def main(doc=None):
     """
@@ -79,12 +79,7 @@ def main(doc=None):
     if we want to be able to run filters automatically
     with '-F panflute'
     """
-    return pf.run_filter(
-        action,
-        prepare=prepare,
-        finalize=finalize,
-        doc=doc)
+    return ReplaceLinkSuffixes().run(doc)
 
 if __name__ == '__main__':
     main()
-
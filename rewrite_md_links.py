@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 Robin Vobruba <hoijui.quaero@gmail.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+This is part of the [MoVeDo](https://github.com/movedo) project.
+See LICENSE.md for copyright information.
+
+Applies the link transformations of the
+`normalize_links`, `add_local_link_prefix` and `replace_link_suffixes` filters
+directly to Markdown source text, without a pandoc parse & render round trip.
+
+The Markdown is only tokenized as far as needed to find
+link & image destinations
+(inline ones like `[text](dest "title")`
+and reference definitions like `[label]: dest "title"`)
+and the `href` & `src` attributes of inline HTML `<a>` & `<img>` tags.
+Only these destinations are replaced,
+everything else is copied to the output byte for byte.
+The input is processed line by line,
+so arbitrarily large files are handled in constant memory.
+
+Known limitations compared to the pandoc filters:
+* Indented code blocks are not recognized
+  (fenced code blocks and code spans are).
+* Inline link destinations have to be on the same line
+  as the closing bracket of the link text.
+* Reference definitions are treated as links,
+  even if only referenced by images.
+
+The filter parameters are given the same way as to pandoc,
+and the filters are applied in the order given on the command line.
+
+Usage example:
+$ python3 rewrite_md_links.py \
+        -F normalize_links \
+        -F add_local_link_prefix \
+        -M allp_prefix="some/static/prefix/" \
+        -M allp_file="input.md" \
+        -o output.md \
+        input.md
+"""
+
+from _common import check_version, parse_meta_args
+check_version()
+
+import re
+import sys
+import argparse
+import importlib
+
+# constants
+# Which kind of link destination each filter applies to,
+# mirroring what the panflute filters handle.
+LINK = 'link'
+IMAGE = 'image'
+HTML_HREF = 'html_href'
+HTML_SRC = 'html_src'
+FILTERS = {
+    'normalize_links': ('NormalizeLinks', 'normalize',
+                        (LINK, IMAGE, HTML_HREF, HTML_SRC)),
+    'add_local_link_prefix': ('AddLocalLinkPrefix', 'prefix_if_rel_path',
+                              (LINK, IMAGE, HTML_HREF, HTML_SRC)),
+    'replace_link_suffixes': ('ReplaceLinkSuffixes', 'replace_link_suffix',
+                              (LINK,)),
+}
+REGEX_FENCE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+REGEX_REF_DEF = re.compile(
+    r'^( {0,3}\[(?:[^\]\\]|\\.)+\]:[ \t]*)(<[^>\n]*>|[^\s<]\S*)')
+REGEX_CODE_SPAN = re.compile(r'(`+)(?:.*?[^`])?\1(?!`)')
+REGEX_INLINE_DEST_START = re.compile(r'\]\([ \t]*')
+REGEX_HTML_TAG = re.compile(r'<(a|img)\b[^>]*>', re.IGNORECASE)
+REGEX_HTML_ATTR = re.compile(
+    r'''(\s(href|src)\s*=\s*)("[^"]*"|'[^']*'|[^\s"'=<>`]+)''',
+    re.IGNORECASE)
+
+class MetaDoc:
+    """
+    Stands in for a `panflute.Doc` when calling the filters `prepare()`,
+    providing just the command line meta-data parameters.
+    """
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+    def get_metadata(self, key, default=None):
+        """Same as `panflute.Doc.get_metadata`, for plain string values."""
+        return self.metadata.get(key, default)
+
+class LinkRewriter:
+    """Applies a chain of link transformations to Markdown text."""
+
+    def __init__(self, transforms):
+        # list of (transform function, kinds it applies to)
+        self.transforms = transforms
+        self.fence = None
+
+    def transform(self, url, kind):
+        """Applies all transforms relevant for this kind of link to the URL."""
+        for func, kinds in self.transforms:
+            if kind in kinds:
+                url = func(url)
+        return url
+
+    def transform_dest(self, dest, kind):
+        """Like `transform()`, but keeps the optional enclosing `<>`."""
+        if dest.startswith('<') and dest.endswith('>'):
+            return '<' + self.transform(dest[1:-1], kind) + '>'
+        return self.transform(dest, kind)
+
+    def rewrite_html(self, text):
+        """Rewrites a.href and img.src attributes in a piece of text."""
+        def rewrite_attr(tag_name, match):
+            attr = match.group(2).lower()
+            if tag_name == 'a' and attr == 'href':
+                kind = HTML_HREF
+            elif tag_name == 'img' and attr == 'src':
+                kind = HTML_SRC
+            else:
+                return match.group(0)
+            value = match.group(3)
+            quote = value[0] if value[0] in '"\'' else ''
+            if quote:
+                value = value[1:-1]
+            return match.group(1) + quote + self.transform(value, kind) + quote
+
+        def rewrite_tag(match):
+            tag_name = match.group(1).lower()
+            return re.sub(REGEX_HTML_ATTR,
+                          lambda attr_match: rewrite_attr(tag_name, attr_match),
+                          match.group(0))
+
+        return re.sub(REGEX_HTML_TAG, rewrite_tag, text)
+
+    def rewrite_inline_links(self, text):
+        """Rewrites the destinations of inline links and images."""
+        out = []
+        pos = 0
+        for match in re.finditer(REGEX_INLINE_DEST_START, text):
+            start = match.end()
+            if start < pos:
+                continue
+            is_image = is_image_dest(text, match.start())
+            if is_image is None:
+                # not preceded by a link text, so not a link at all
+                continue
+            end = find_dest_end(text, start)
+            if end is None:
+                continue
+            kind = IMAGE if is_image else LINK
+            out.append(text[pos:start])
+            out.append(self.transform_dest(text[start:end], kind))
+            pos = end
+        out.append(text[pos:])
+        return ''.join(out)
+
+    def rewrite_inline(self, text):
+        """Rewrites all link destinations in text outside of code spans."""
+        out = []
+        pos = 0
+        for match in re.finditer(REGEX_CODE_SPAN, text):
+            out.append(self.rewrite_html(
+                self.rewrite_inline_links(text[pos:match.start()])))
+            out.append(match.group(0))
+            pos = match.end()
+        out.append(self.rewrite_html(self.rewrite_inline_links(text[pos:])))
+        return ''.join(out)
+
+    def rewrite_line(self, line):
+        """Rewrites all link destinations in a single line of Markdown."""
+        fence_match = re.match(REGEX_FENCE, line)
+        if self.fence is not None:
+            if fence_match and fence_match.group(1)[0] == self.fence[0] \
+                    and len(fence_match.group(1)) >= len(self.fence) \
+                    and line.strip() == fence_match.group(1).strip():
+                self.fence = None
+            return line
+        if fence_match:
+            self.fence = fence_match.group(1)
+            return line
+        ref_match = re.match(REGEX_REF_DEF, line)
+        if ref_match:
+            rest = line[ref_match.end():]
+            return (ref_match.group(1)
+                    + self.transform_dest(ref_match.group(2), LINK)
+                    + self.rewrite_inline(rest))
+        return self.rewrite_inline(line)
+
+    def rewrite(self, in_stream, out_stream):
+        """Rewrites a whole Markdown document, line by line."""
+        self.fence = None
+        for line in in_stream:
+            out_stream.write(self.rewrite_line(line))
+
+def is_image_dest(text, bracket_pos):
+    """
+    Returns True if the link text closed by the bracket at `bracket_pos`
+    was opened with `![`, False if it was opened with `[`,
+    or None if there is no opening bracket at all.
+    """
+    depth = 0
+    idx = bracket_pos - 1
+    while idx >= 0:
+        char = text[idx]
+        if idx > 0 and text[idx - 1] == '\\':
+            idx -= 2
+            continue
+        if char == ']':
+            depth += 1
+        elif char == '[':
+            if depth == 0:
+                return idx > 0 and text[idx - 1] == '!'
+            depth -= 1
+        idx -= 1
+    return None
+
+def find_dest_end(text, start):
+    """
+    Returns the index right after the link destination starting at `start`,
+    or None if there is no valid destination.
+    """
+    if start >= len(text):
+        return None
+    if text[start] == '<':
+        end = text.find('>', start)
+        return None if end == -1 else end + 1
+    depth = 0
+    idx = start
+    while idx < len(text):
+        char = text[idx]
+        if char == '\\' and idx + 1 < len(text):
+            idx += 2
+            continue
+        if char.isspace():
+            break
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            if depth == 0:
+                break
+            depth -= 1
+        idx += 1
+    if idx == start:
+        return None
+    return idx
+
+def load_transforms(filter_names, doc):
+    """Imports the given filters, prepares them and returns their transforms."""
+    transforms = []
+    for filter_name in filter_names:
+        if filter_name not in FILTERS:
+            raise ValueError("Unsupported filter '%s'; supported are: %s"
+                             % (filter_name, ', '.join(FILTERS)))
+        class_name, func_name, kinds = FILTERS[filter_name]
+        module = importlib.import_module(filter_name)
+        filter_obj = getattr(module, class_name)()
+        filter_obj.prepare(doc)
+        transforms.append((getattr(filter_obj, func_name), kinds))
+    return transforms
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        description='Rewrites link destinations in Markdown, without pandoc.')
+    parser.add_argument('-F', '--filter', dest='filters', action='append',
+                        default=[], choices=list(FILTERS),
+                        help='a filter to apply; may be given multiple times')
+    parser.add_argument('-M', '--metadata', dest='meta', action='append',
+                        default=[], metavar='KEY=VALUE',
+                        help='a filter parameter, like pandoc -M')
+    parser.add_argument('-o', '--output', default='-',
+                        help='the output file, or "-" for stdout (default)')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='the input file, or "-" for stdin (default)')
+    args = parser.parse_args(argv)
+
+    doc = MetaDoc(parse_meta_args(args.meta))
+    rewriter = LinkRewriter(load_transforms(args.filters, doc))
+    in_stream = sys.stdin if args.input == '-' \
+        else open(args.input, 'r', encoding='utf-8', newline='')
+    out_stream = sys.stdout if args.output == '-' \
+        else open(args.output, 'w', encoding='utf-8', newline='')
+    try:
+        rewriter.rewrite(in_stream, out_stream)
+    finally:
+        if in_stream is not sys.stdin:
+            in_stream.close()
+        if out_stream is not sys.stdout:
+            out_stream.close()
+
+if __name__ == '__main__':
+    main()
@@ -17,6 +17,15 @@ This might typicaly be used to shift all headers of a Markdown file
 down by one level, if multiple such files are to be combined into a single one,
 each prependet by a top-level header.
 
+Instead of a fixed shift, one may supply the level
+the top-most header(s) of the document should end up on (`sh_auto_top_level`).
+The document is then pre-scanned for its min and max header levels,
+and the shift is derived from that,
+so there is no need to run `extract_header_structure.py` beforehand.
+
+Headers that end up outside of the valid level range
+are reported in a single summary on stderr.
+
 Usage example:
 $ pandoc -f markdown -t markdown --markdown-headings=atx \
         -M sh_shift=1 \
@@ -25,9 +34,16 @@ $ pandoc -f markdown -t markdown --markdown-headings=atx \
         --filter shift_headers.py \
         -o output.md \
         input.md
+
+or:
+$ pandoc -f markdown -t markdown --markdown-headings=atx \
+        -M sh_auto_top_level=2 \
+        --filter shift_headers.py \
+        -o output.md \
+        input.md
 """
 
-from _common import check_version, eprint, get_arg
+from _common import check_version, eprint, Filter
 check_version()
 
 import panflute as pf
@@ -36,61 +52,133 @@ import panflute as pf
 MIN_LEVEL = 1
 # NOTE This will be 10 in future pandoc versions (not yet in pandoc 2.7.3)
 MAX_LEVEL = 6
+# what becomes of a header after shifting
+TO_HEADER = 'header'
+TO_STRONG = 'strong'
+TO_EMPH = 'emph'
+TO_UNCHANGED = 'unchanged'
 
-# parameters
-# shift is usually (+)1, could be -1, but seldomly something else
-shift = +1
-# if True, instead of an exception when resulting header levels are below MIN_LEVEL,
-# we leave it at the original level
-workaround_level_overflow = True
-# if True, instead of an exception when resulting header levels are above MAX_LEVEL,
-# we convert it into an emphazised paragraph
-workaround_level_underflow = False
-
-def prepare(doc):
-    """The panflute filter init method."""
-    global shift, workaround_level_overflow, workaround_level_underflow
-    shift = int(get_arg(doc, 'sh_shift'))
-    workaround_level_overflow = get_arg(doc,
-        'sh_workaround_level_overflow', 'True') == 'True'
-    workaround_level_underflow = get_arg(doc,
-        'sh_workaround_level_underflow', 'False') == 'True'
-
-def action(elem, doc):
-    """The panflute filter main method, called once per element."""
-    global shift, workaround_level_overflow, workaround_level_underflow
-    if isinstance(elem, pf.Header):
-        level_old = elem.level
-        level_new = level_old + shift
-        if level_new > MAX_LEVEL:
-            eprint(
-                "After shifting header levels by %d, '%s' would be on level %d, "
-                "which is above the max level %d."
-                % (shift, elem.identifier, level_new, MAX_LEVEL))
-            if workaround_level_overflow:
-                eprint("Thus we convert it to an emphazised text paragraph instead.")
+def scan_header_levels(doc):
+    """Returns the min and max header level of a document, or None if it has no headers."""
+    levels = set()
+
+    def collect(elem, doc):
+        if isinstance(elem, pf.Header):
+            levels.add(elem.level)
+
+    doc.walk(collect)
+    if not levels:
+        return None
+    return (min(levels), max(levels))
+
+def header_name(elem):
+    """Returns the identifier of a header, or its text if it has none."""
+    if elem.identifier != '':
+        return elem.identifier
+    return "'%s'" % pf.stringify(elem)
+
+class ShiftHeaders(Filter):
+    """Shifts the level of all headers by a configurable amount."""
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        # parameters
+        # shift is usually (+)1, could be -1, but seldomly something else
+        self.shift = +1
+        # if True, instead of an exception when resulting header levels are below MIN_LEVEL,
+        # we leave it at the original level
+        self.workaround_level_overflow = True
+        # if True, instead of an exception when resulting header levels are above MAX_LEVEL,
+        # we convert it into an emphazised paragraph
+        self.workaround_level_underflow = False
+        # state
+        # old level -> (TO_*, new level)
+        self.level_map = {}
+        # identifiers of the headers which ended up outside the valid level range
+        self.overflown = []
+        self.underflown = []
+
+    def map_level(self, level_old):
+        """
+        Returns what becomes of a header of the given level after shifting,
+        as a tuple (TO_*, new level).
+        """
+        if level_old not in self.level_map:
+            level_new = level_old + self.shift
+            if level_new > MAX_LEVEL:
+                if not self.workaround_level_overflow:
+                    raise OverflowError(
+                        "After shifting header levels by %d, level %d would become %d, "
+                        "which is above the max level %d."
+                        % (self.shift, level_old, level_new, MAX_LEVEL))
                 if level_new == (MAX_LEVEL + 1):
-                    elem = pf.Para(pf.Strong(*elem.content))
+                    self.level_map[level_old] = (TO_STRONG, level_new)
                 else:
-                    elem = pf.Para(pf.Emph(*elem.content))
+                    self.level_map[level_old] = (TO_EMPH, level_new)
+            elif level_new < MIN_LEVEL:
+                if not self.workaround_level_underflow:
+                    raise OverflowError(
+                        "After shifting header levels by %d, level %d would become %d, "
+                        "which is below the min level %d."
+                        % (self.shift, level_old, level_new, MIN_LEVEL))
+                self.level_map[level_old] = (TO_UNCHANGED, level_new)
             else:
-                raise OverflowError()
-        elif level_new < MIN_LEVEL:
-            eprint(
-                "After shifting header levels by %d, '%s' would be on level %d, "
-                "which is below the min level %d."
-                % (shift, elem.identifier, level_new, MIN_LEVEL))
-            if workaround_level_underflow:
-                eprint("Thus we leave it at the min level.")
-            else:
-                raise OverflowError()
+                self.level_map[level_old] = (TO_HEADER, level_new)
+        return self.level_map[level_old]
+
+    def prepare(self, doc):
+        """The panflute filter init method."""
+        self.workaround_level_overflow = self.get_arg(doc,
+            'sh_workaround_level_overflow', 'True') == 'True'
+        self.workaround_level_underflow = self.get_arg(doc,
+            'sh_workaround_level_underflow', 'False') == 'True'
+        auto_top_level = self.get_arg(doc, 'sh_auto_top_level', '')
+        level_range = None
+        if auto_top_level != '' or not self.workaround_level_overflow \
+                or not self.workaround_level_underflow:
+            level_range = scan_header_levels(doc)
+        if auto_top_level != '':
+            min_level = MIN_LEVEL if level_range is None else level_range[0]
+            self.shift = int(auto_top_level) - min_level
         else:
-            elem.level = level_new
-    return elem
+            self.shift = int(self.get_arg(doc, 'sh_shift'))
+        self.level_map = {}
+        self.overflown = []
+        self.underflown = []
+        if level_range is not None:
+            # Fails right away if the extreme levels can not be shifted
+            # without a workaround, instead of in the middle of the document
+            for level in level_range:
+                self.map_level(level)
 
-def finalize(doc):
-    """The panflute filter "destructor" method."""
-    pass
+    def action(self, elem, doc):
+        """The panflute filter main method, called once per element."""
+        if isinstance(elem, pf.Header):
+            to_kind, level_new = self.map_level(elem.level)
+            if to_kind == TO_HEADER:
+                elem.level = level_new
+            elif to_kind == TO_UNCHANGED:
+                self.underflown.append(header_name(elem))
+            else:
+                self.overflown.append(header_name(elem))
+                if to_kind == TO_STRONG:
+                    elem = pf.Para(pf.Strong(*elem.content))
+                else:
+                    elem = pf.Para(pf.Emph(*elem.content))
+        return elem
+
+    def finalize(self, doc):
+        """The panflute filter "destructor" method."""
+        if self.overflown:
+            eprint(
+                "After shifting header levels by %d, %d header(s) would be above the max level %d; "
+                "thus we converted them to emphazised text paragraphs instead: %s"
+                % (self.shift, len(self.overflown), MAX_LEVEL, ', '.join(self.overflown)))
+        if self.underflown:
+            eprint(
+                "After shifting header levels by %d, %d header(s) would be below the min level %d; "
+                "thus we left them at their original level: %s"
+                % (self.shift, len(self.underflown), MIN_LEVEL, ', '.join(self.underflown)))
 
 def main(doc=None):
     """
@@ -98,11 +186,7 @@ def main(doc=None):
     if we want to be able to run filters automatically
     with '-F panflute'
     """
-    return pf.run_filter(
-        action,
-        prepare=prepare,
-        finalize=finalize,
-        doc=doc)
+    return ShiftHeaders().run(doc)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,123 @@
+# SPDX-FileCopyrightText: 2021 Robin Vobruba <hoijui.quaero@gmail.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Tests `check_urls.py` against a local stub HTTP server.
+"""
+
+import os
+import sys
+import time
+import socket
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_urls import UrlCache, check_urls, request_target, is_ok
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers with a status depending on the path, and records all requests."""
+
+    # keep-alive connections
+    protocol_version = 'HTTP/1.1'
+
+    def respond(self):
+        self.server.requests.append((self.command, self.path))
+        self.server.client_ports.add(self.client_address[1])
+        if self.path.startswith('/ok') or self.path.startswith('/%C3%A4'):
+            status = 200
+        elif self.path == '/no-head':
+            status = 405 if self.command == 'HEAD' else 200
+        else:
+            status = 404
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_HEAD = respond
+    do_GET = respond
+
+    def log_message(self, *args):
+        pass
+
+def unused_port():
+    """Returns a local port nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class CheckUrlsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.requests = []
+        self.server.client_ports = set()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def check(self, urls, cache=None):
+        return check_urls(urls, cache or UrlCache(), per_host=1, jobs=4, timeout=5)
+
+    def test_head(self):
+        results = self.check([self.base + '/ok'])
+        self.assertEqual(results[self.base + '/ok'], (200, None))
+        self.assertEqual(self.server.requests, [('HEAD', '/ok')])
+
+    def test_get_fallback(self):
+        results = self.check([self.base + '/no-head'])
+        self.assertEqual(results[self.base + '/no-head'], (200, None))
+        self.assertEqual(self.server.requests, [('HEAD', '/no-head'), ('GET', '/no-head')])
+
+    def test_not_found(self):
+        status, _ = self.check([self.base + '/missing'])[self.base + '/missing']
+        self.assertEqual(status, 404)
+        self.assertFalse(is_ok(status))
+
+    def test_non_ascii_path(self):
+        url = self.base + '/ä ö?q=ü'
+        self.assertEqual(self.check([url])[url], (200, None))
+        self.assertEqual(self.server.requests, [('HEAD', '/%C3%A4%20%C3%B6?q=%C3%BC')])
+
+    def test_idna_host(self):
+        key, path = request_target('https://bücher.example:8443/a b')
+        self.assertEqual(key, ('https', 'xn--bcher-kva.example:8443'))
+        self.assertEqual(path, '/a%20b')
+
+    def test_connection_refused(self):
+        url = 'http://127.0.0.1:%d/ok' % unused_port()
+        status, error = self.check([url])[url]
+        self.assertIsNone(status)
+        self.assertIn('ConnectionRefusedError', error)
+
+    def test_keep_alive(self):
+        urls = [self.base + '/ok%d' % num for num in range(5)]
+        results = self.check(urls)
+        self.assertTrue(all(result == (200, None) for result in results.values()))
+        self.assertEqual(len(self.server.client_ports), 1)
+
+    def test_cache_reuse(self):
+        cache = UrlCache()
+        self.check([self.base + '/ok'], cache)
+        results = self.check([self.base + '/ok'], cache)
+        self.assertEqual(results[self.base + '/ok'], (200, None))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_cache_ttl(self):
+        cache = UrlCache(ttl=3600, error_ttl=60)
+        cache.put('http://status.example/', 404, None)
+        cache.put('http://error.example/', None, 'ConnectionRefusedError: refused')
+        for entry in cache.entries.values():
+            entry[0] = time.time() - 120
+        self.assertEqual(cache.get('http://status.example/'), (404, None))
+        self.assertIsNone(cache.get('http://error.example/'))
+
+if __name__ == '__main__':
+    unittest.main()